@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки pycdek на локальном сервере, имитирующем API СДЭК
+Каждый сценарий выполняется в отдельном процессе, поэтому пиковая память не смешивается между сценариями.
+
+    python benchmarks/run.py --output results-0.3.1.json
+    python benchmarks/run.py --compare results-0.3.1.json
+"""
+import os
+import sys
+import json
+import platform
+import resource
+import argparse
+import subprocess
+import multiprocessing
+from timeit import default_timer
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pycdek
+from pycdek import AbstractOrder, AbstractOrderLine, Client, PooledTransport
+from pycdek.xmlwriter import XmlWriter
+from server import load_payloads, make_server
+
+STATUS_BATCH = 100
+BULK_ORDERS = 500
+
+
+class BenchOrderLine(AbstractOrderLine):
+    quantity = 2
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_product_title(self):
+        return u'Товар %d' % self.index
+
+    def get_product_upc(self):
+        return 'UPC%08d' % self.index
+
+    def get_product_weight(self):
+        return 500 + self.index
+
+    def get_product_price(self):
+        return 1000
+
+    def get_product_payment(self):
+        return 0
+
+
+class BenchOrder(AbstractOrder):
+    sender_city_id = 44
+    recipient_name = u'Иванов Иван Иванович'
+    recipient_phone = '+7 (999) 999-99-99'
+    recipient_city_id = 137
+    recipient_city_postcode = 198261
+    recipient_address_street = u'пр. Ленина'
+    recipient_address_house = 1
+    recipient_address_flat = 1
+    pvz_code = None
+    shipping_tariff = 136
+    shipping_price = 0
+
+    def __init__(self, number):
+        self.number = number
+
+    def get_products(self):
+        return [BenchOrderLine(i) for i in xrange(3)]
+
+
+def make_client(base_url):
+    class BenchClient(Client):
+        INTEGRATOR_URL = base_url
+        CALCULATOR_URL = base_url + '/calculator/calculate_price_by_json.php'
+        CREATE_ORDER_URL = base_url + '/new_orders.php'
+        DELETE_ORDER_URL = base_url + '/delete_orders.php'
+        ORDER_STATUS_URL = base_url + '/status_report_h.php'
+        ORDER_INFO_URL = base_url + '/info_report.php'
+        ORDER_PRINT_URL = base_url + '/orders_print.php'
+        DELIVERY_POINTS_URL = base_url + '/pvzlist.php'
+        CALL_COURIER_URL = base_url + '/call_courier.php'
+        transport = PooledTransport()
+
+    return BenchClient('login', 'password')
+
+
+def dispatch_numbers(i):
+    return ['1%09d' % (i * STATUS_BATCH + j) for j in xrange(STATUS_BATCH)]
+
+
+def scenario_create_order(client):
+    return lambda i: client.create_order(BenchOrder(i))
+
+
+def scenario_create_orders_bulk(client):
+    return lambda i: client.create_orders([BenchOrder(i * BULK_ORDERS + j) for j in xrange(BULK_ORDERS)])
+
+
+def scenario_get_orders_statuses(client):
+    return lambda i: client.get_orders_statuses(dispatch_numbers(i))
+
+
+def scenario_iter_orders_statuses(client):
+    return lambda i: sum(1 for _ in client.iter_orders_statuses(dispatch_numbers(i)))
+
+
+def scenario_get_delivery_points(client):
+    return lambda i: client.get_delivery_points()
+
+
+def scenario_iter_delivery_points(client):
+    return lambda i: sum(1 for _ in client.iter_delivery_points())
+
+
+def scenario_get_shipping_cost(client):
+    return lambda i: client.get_shipping_cost(44, 137, [11, 16, 137], [{'weight': 1 + i % 10, 'length': 50, 'width': 10, 'height': 20}])
+
+
+def scenario_parse_pvzlist(client):
+    payload = client._exec_request(client.DELIVERY_POINTS_URL, {})
+    return lambda i: [client._xml_to_dict(point) for point in client._parse_xml(payload).findall('Pvz')]
+
+
+def scenario_parse_status_report(client):
+    payload = client._exec_request(client.ORDER_STATUS_URL, client._prepare_status_report(dispatch_numbers(0), True), 'POST')
+    return lambda i: [client._xml_to_dict(order) for order in client._parse_xml(payload).findall('Order')]
+
+
+def scenario_serialize_orders(client):
+    orders = [BenchOrder(j) for j in xrange(BULK_ORDERS)]
+
+    def serialize(i):
+        writer = XmlWriter()
+        for order in orders:
+            client._write_order(writer, order, order.get_products_data())
+        return client._prepare_xml_request(client.CREATE_ORDER_URL, 'DeliveryRequest', {'Number': str(i), 'OrderCount': str(len(orders))}, writer.getvalue())
+
+    return serialize
+
+
+SCENARIOS = OrderedDict([
+    ('create_order', (scenario_create_order, 200)),
+    ('create_orders_bulk', (scenario_create_orders_bulk, 10)),
+    ('get_orders_statuses', (scenario_get_orders_statuses, 100)),
+    ('iter_orders_statuses', (scenario_iter_orders_statuses, 100)),
+    ('get_delivery_points', (scenario_get_delivery_points, 10)),
+    ('iter_delivery_points', (scenario_iter_delivery_points, 10)),
+    ('get_shipping_cost', (scenario_get_shipping_cost, 500)),
+    ('parse_pvzlist', (scenario_parse_pvzlist, 10)),
+    ('parse_status_report', (scenario_parse_status_report, 100)),
+    ('serialize_orders', (scenario_serialize_orders, 20)),
+])
+
+
+def percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def run_scenario(name, base_url, iterations=None, warmup=2):
+    factory, default_iterations = SCENARIOS[name]
+    iterations = iterations or default_iterations
+    client = make_client(base_url)
+    func = factory(client)
+    # ru_maxrss - максимум за время жизни процесса, поэтому базовое значение берется до прогрева
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for i in xrange(warmup):
+        func(i)
+
+    latencies = []
+    started_at = default_timer()
+    for i in xrange(iterations):
+        call_started_at = default_timer()
+        func(i)
+        latencies.append(default_timer() - call_started_at)
+    total = default_timer() - started_at
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies.sort()
+    return OrderedDict([
+        ('iterations', iterations),
+        ('throughput', iterations / total),
+        ('mean', total / iterations),
+        ('p50', percentile(latencies, 50)),
+        ('p95', percentile(latencies, 95)),
+        ('p99', percentile(latencies, 99)),
+        ('max', latencies[-1]),
+        ('max_rss_kb', max_rss),
+        ('rss_growth_kb', max_rss - base_rss),
+    ])
+
+
+def serve(payloads_dir, pvz_count, connection):
+    server = make_server(payloads=load_payloads(payloads_dir, pvz_count))
+    connection.send(server.server_address)
+    server.serve_forever()
+
+
+def compare(previous, current):
+    metrics = ('throughput', 'p50', 'p95', 'p99', 'max_rss_kb')
+    print '%-24s %-12s %14s %14s %9s' % ('scenario', 'metric', 'previous', 'current', 'change')
+    for name, result in current['scenarios'].items():
+        previous_result = previous['scenarios'].get(name)
+        if previous_result is None:
+            continue
+        for metric in metrics:
+            old, new = previous_result[metric], result[metric]
+            change = (new - old) * 100.0 / old if old else 0
+            print '%-24s %-12s %14.6g %14.6g %+8.1f%%' % (name, metric, old, new, change)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.decode('utf-8').strip().splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', help=u'сценарии, по умолчанию все: %s' % ', '.join(SCENARIOS))
+    parser.add_argument('--iterations', type=int, help=u'количество итераций каждого сценария')
+    parser.add_argument('--payloads', help=u'каталог с записанными ответами API (см. server.py)')
+    parser.add_argument('--pvz-count', type=int, default=5000, help=u'размер сгенерированного списка ПВЗ')
+    parser.add_argument('--output', help=u'файл для сохранения результатов в JSON')
+    parser.add_argument('--compare', help=u'файл с результатами предыдущего запуска')
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.url:
+        # дочерний процесс: один сценарий, результат в stdout
+        print json.dumps(run_scenario(args.scenarios[0], args.url, args.iterations))
+        return
+
+    parent_connection, child_connection = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(target=serve, args=(args.payloads, args.pvz_count, child_connection))
+    server_process.daemon = True
+    server_process.start()
+    base_url = 'http://%s:%d' % parent_connection.recv()
+
+    results = OrderedDict([
+        ('pycdek', pycdek.__version__),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('pvz_count', args.pvz_count),
+        ('payloads', args.payloads),
+        ('scenarios', OrderedDict()),
+    ])
+    try:
+        for name in args.scenarios or SCENARIOS:
+            command = [sys.executable, os.path.abspath(__file__), name, '--url', base_url]
+            if args.iterations:
+                command += ['--iterations', str(args.iterations)]
+            result = json.loads(subprocess.check_output(command), object_pairs_hook=OrderedDict)
+            results['scenarios'][name] = result
+            print '%-24s %8.1f ops/s  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  rss %7d kB' % (
+                name, result['throughput'], result['p50'] * 1000, result['p95'] * 1000, result['p99'] * 1000, result['max_rss_kb'])
+    finally:
+        server_process.terminate()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f, object_pairs_hook=OrderedDict), results)
+
+
+if __name__ == '__main__':
+    main()
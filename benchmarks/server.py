@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный сервер, имитирующий API интегратора и калькулятора СДЭК для бенчмарков
+Ответы генерируются детерминированно либо берутся из каталога записанных ответов:
+pvzlist.xml, status_report_h.xml, new_orders.xml, info_report.xml, orders_print.pdf, calculator.json
+"""
+import os
+import re
+import sys
+import json
+import random
+import urlparse
+import argparse
+import SocketServer
+import BaseHTTPServer
+from xml.sax.saxutils import quoteattr
+
+CITIES = [(44, u'Москва', 55.75, 37.62), (137, u'Санкт-Петербург', 59.94, 30.31), (270, u'Новосибирск', 55.03, 82.92),
+          (250, u'Екатеринбург', 56.84, 60.61), (424, u'Казань', 55.79, 49.12), (414, u'Нижний Новгород', 56.33, 44.0)]
+STATES = [(1, u'Создан'), (3, u'Принят на склад отправителя'), (6, u'Выдан на отправку в г.-отправителе'),
+          (7, u'Сдан перевозчику в г.-отправителе'), (21, u'Отправлен в г.-транзит'), (8, u'Отправлен в г.-получатель'),
+          (10, u'Принят на склад доставки'), (12, u'Принят на склад до востребования'), (4, u'Вручен')]
+
+
+def element(tag, attrib, children=''):
+    attributes = ''.join(' %s=%s' % (name, quoteattr(unicode(value))) for name, value in sorted(attrib.items()))
+    if children:
+        return u'<%s%s>%s</%s>' % (tag, attributes, children, tag)
+
+    return u'<%s%s />' % (tag, attributes)
+
+
+def generate_pvzlist(count, seed=1):
+    rnd = random.Random(seed)
+    points = []
+    for i in xrange(count):
+        city_code, city, latitude, longitude = CITIES[i % len(CITIES)]
+        work_time = ''.join(element('WorkTimeY', {'day': day, 'periods': '10:00/20:00'}) for day in xrange(1, 8))
+        points.append(element('Pvz', {
+            'Code': 'PVZ%05d' % i,
+            'Name': u'Пункт выдачи %d' % i,
+            'CityCode': city_code,
+            'City': city,
+            'PostalCode': 100000 + rnd.randint(0, 99999),
+            'WorkTime': u'Пн-Пт 10:00-20:00, Сб-Вс 10:00-18:00',
+            'Address': u'ул. Тестовая, д. %d, оф. %d' % (rnd.randint(1, 200), rnd.randint(1, 50)),
+            'Phone': '+7 (%03d) %03d-%02d-%02d' % (rnd.randint(900, 999), rnd.randint(0, 999), rnd.randint(0, 99), rnd.randint(0, 99)),
+            'Note': u'Вход со двора, второй этаж',
+            'coordX': '%.6f' % (longitude + rnd.uniform(-0.3, 0.3)),
+            'coordY': '%.6f' % (latitude + rnd.uniform(-0.2, 0.2)),
+            'Type': 'PVZ',
+        }, work_time + element('WeightLimit', {'WeightMin': 0, 'WeightMax': 30})))
+
+    return (u'<?xml version="1.0" encoding="UTF-8"?><PvzList>%s</PvzList>' % ''.join(points)).encode('utf-8')
+
+
+def generate_status_report(dispatch_numbers, show_history=True):
+    orders = []
+    for dispatch_number in dispatch_numbers:
+        day = int(dispatch_number) % 20 + 1
+        states = STATES[:int(dispatch_number) % len(STATES) + 1]
+        history = ''.join(element('State', {
+            'Date': '2015-03-%02dT%02d:00:00+03:00' % (day, 8 + i), 'Code': code, 'Description': description,
+            'CityCode': 44, 'CityName': u'Москва',
+        }) for i, (code, description) in enumerate(states)) if show_history else ''
+        code, description = states[-1]
+        status = element('Status', {
+            'Date': '2015-03-%02dT%02d:00:00+03:00' % (day, 7 + len(states)), 'Code': code, 'Description': description,
+            'CityCode': 44, 'CityName': u'Москва',
+        }, history)
+        package = element('Package', {'Number': '1', 'BarCode': dispatch_number},
+                          element('Item', {'WareKey': '25000050368', 'Amount': 2, 'DelivAmount': 2}))
+        orders.append(element('Order', {
+            'ActNumber': '', 'Number': dispatch_number[1:], 'DispatchNumber': dispatch_number,
+            'DeliveryDate': '', 'RecipientName': u'Иванов Иван Иванович',
+        }, status + element('Reason', {'Code': '', 'Description': '', 'Date': ''}) + package))
+
+    return (u'<?xml version="1.0" encoding="UTF-8"?><StatusReport DateFirst="2015-03-01" DateLast="2015-03-31">%s</StatusReport>' % ''.join(orders)).encode('utf-8')
+
+
+def generate_new_orders(numbers):
+    orders = ''.join(element('Order', {'Number': number, 'DispatchNumber': '1%09d' % int(number)}) for number in numbers)
+    summary = element('Order', {'Msg': u'Добавлено заказов %d' % len(numbers)})
+    return (u'<?xml version="1.0" encoding="UTF-8"?><response>%s%s</response>' % (orders, summary)).encode('utf-8')
+
+
+def generate_calculator(params):
+    tariff = params['tariffList'][0]['id'] if params.get('tariffList') else params.get('tariffId')
+    weight = sum(float(item.get('weight', 0)) for item in params.get('goods', []))
+    return json.dumps({'result': {
+        'price': '%.1f' % (250 + 40 * weight + int(tariff) % 7 * 30),
+        'deliveryPeriodMin': 2,
+        'deliveryPeriodMax': 4,
+        'tariffId': tariff,
+        'currency': 'RUB',
+    }})
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type='text/xml; charset=utf-8'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _xml_request(self, body):
+        return urlparse.parse_qs(body).get('xml_request', [''])[0]
+
+    def do_GET(self):
+        path = urlparse.urlsplit(self.path).path
+        if path.endswith('/pvzlist.php'):
+            self._send(self.server.payloads['pvzlist.xml'])
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = urlparse.urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.getheader('Content-Length') or 0))
+        payloads = self.server.payloads
+        endpoint = path.rsplit('/', 1)[-1]
+
+        if endpoint == 'status_report_h.php':
+            xml = self._xml_request(body)
+            response = payloads.get('status_report_h.xml') or generate_status_report(
+                re.findall(r'DispatchNumber="([^"]+)"', xml), 'ShowHistory="1"' in xml)
+        elif endpoint == 'info_report.php':
+            response = payloads.get('info_report.xml') or generate_status_report(
+                re.findall(r'DispatchNumber="([^"]+)"', self._xml_request(body)), False)
+        elif endpoint == 'new_orders.php':
+            numbers = re.findall(r'<Order [^>]*?Number="([^"]+)"', self._xml_request(body))
+            response = payloads.get('new_orders.xml') or generate_new_orders(numbers)
+        elif endpoint == 'orders_print.php':
+            response = payloads.get('orders_print.pdf') or '%PDF-1.4\n' + 'x' * 65536 + '\n%%EOF'
+            return self._send(response, 'application/pdf')
+        elif endpoint == 'calculate_price_by_json.php':
+            response = payloads.get('calculator.json') or generate_calculator(json.loads(body))
+            return self._send(response, 'application/json')
+        else:
+            return self.send_error(404)
+
+        self._send(response)
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def load_payloads(directory=None, pvz_count=5000):
+    payloads = {}
+    if directory:
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name), 'rb') as f:
+                payloads[name] = f.read()
+
+    if 'pvzlist.xml' not in payloads:
+        payloads['pvzlist.xml'] = generate_pvzlist(pvz_count)
+
+    return payloads
+
+
+def make_server(host='127.0.0.1', port=0, payloads=None):
+    server = Server((host, port), Handler)
+    server.payloads = payloads if payloads is not None else load_payloads()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.decode('utf-8').strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8011)
+    parser.add_argument('--payloads', help=u'каталог с записанными ответами')
+    parser.add_argument('--pvz-count', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, load_payloads(args.payloads, args.pvz_count))
+    print 'Listening on http://%s:%d' % server.server_address
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+from collections import defaultdict
 from django.db import models
-from pycdek import AbstractOrder, AbstractOrderLine, Client
+from pycdek import AbstractOrder, AbstractOrderLine, Client, OrderLineData
 
 
 class Product(models.Model):
@@ -35,6 +36,31 @@ class Order(AbstractOrder, models.Model):
     def get_comment(self):
         return self.comment
 
+    def get_products_data(self):
+        return self.load_products_data([self])[0]
+
+    @classmethod
+    def load_products_data(cls, orders):
+        # товары всех заказов одним запросом вместо запроса на каждый товар
+        lines = defaultdict(list)
+        for line in OrderLine.objects.filter(order__in=orders).select_related('product'):
+            lines[line.order_id].append(line)
+
+        return [
+            [
+                OrderLineData(
+                    title=line.product.title,
+                    upc=line.product.id,
+                    weight=line.product.weight,
+                    quantity=line.quantity,
+                    price=line.product.price,
+                    payment=0 if order.is_paid else line.product.price,
+                )
+                for line in lines[order.id]
+            ]
+            for order in orders
+        ]
+
 
 class OrderLine(AbstractOrderLine, models.Model):
     order = models.ForeignKey(Order, related_name='lines')
@@ -96,6 +122,11 @@ OrderLine.objects.create(product=product, order=order)
 response = client.create_order(order)
 dispatch_number = response['DispatchNumber']
 
+# создание всех неоплаченных заказов пачками по 100 заказов
+for result in client.create_orders(Order.objects.filter(is_paid=False)):
+    if result.error:
+        print result.order.get_number(), result.error
+
 # получение накладной к заказу
 with open('Заказ #%s.pdf' % order.get_number(), 'wb') as f:
     data = client.get_orders_print([dispatch_number])
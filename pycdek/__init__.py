@@ -1,4 +1,18 @@
-from client import AbstractOrder, AbstractOrderLine, Client
+from client import AbstractOrder, AbstractOrderLine, Client, CreateOrderResult, OrderLineData, PrintResult
+from transport import Transport, UrllibTransport, PooledTransport
+from async_client import AsyncClient
+from cache import QuoteCache, MemoryQuoteCache, StoreQuoteCache
+from catalog import DeliveryPointCatalog
+from snapshot import DeliveryPointSnapshot, write_snapshot
+from tracking import StatusTracker
+from events import StatusFeed, StatusEvent
+from records import Record, Pvz, OrderStatus, Status, State, Delay, Package, Item
+from policy import RequestPolicy, CircuitBreaker, CircuitOpenError, RateLimiter, ConcurrencyLimiter
+from metrics import Metrics, InMemoryMetrics
+from quotes import QuoteEngine, Quote, Route, cheapest, fastest, cheapest_within
+from estimates import TariffEstimator, Estimate
+from pool import ClientPool
+from signing import Signer
 VERSION = (0, 3, 1)
 
 
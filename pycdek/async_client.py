@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from multiprocessing.pool import ThreadPool
+
+from client import Client
+from policy import ConcurrencyLimiter
+
+
+class AsyncClient(Client):
+    """
+    Клиент, выполняющий запросы в фоне на ограниченном пуле потоков.
+    Методы возвращают AsyncResult, результат получается вызовом get([timeout]).
+    Сборка XML, подпись и разбор ответов общие с Client.
+    create_orders и print_orders выполняют части параллельно в собственных потоках,
+    поэтому количество одновременных запросов ограничивается concurrency_limiter, а не только пулом.
+    """
+
+    def __init__(self, login, password, transport=None, concurrency=10, **kwargs):
+        """
+        :param concurrency: максимальное количество одновременных запросов
+        :param kwargs: остальные параметры Client, по умолчанию concurrency_limiter=ConcurrencyLimiter(concurrency)
+        """
+        if kwargs.get('concurrency_limiter') is None:
+            kwargs['concurrency_limiter'] = ConcurrencyLimiter(concurrency)
+        super(AsyncClient, self).__init__(login, password, transport, **kwargs)
+        self.concurrency = concurrency
+        self._pool = ThreadPool(concurrency)
+
+    def _submit(self, method, *args, **kwargs):
+        return self._pool.apply_async(method, args, kwargs)
+
+    def close(self):
+        """ Дождаться выполнения запущенных запросов и остановить пул потоков """
+        self._pool.close()
+        self._pool.join()
+
+    def get_shipping_cost(self, sender_city_id, receiver_city_id, tariffs, goods):
+        return self._submit(super(AsyncClient, self).get_shipping_cost, sender_city_id, receiver_city_id, tariffs, goods)
+
+    def get_delivery_points(self, city_id=None):
+        return self._submit(super(AsyncClient, self).get_delivery_points, city_id)
+
+    def create_order(self, order):
+        return self._submit(super(AsyncClient, self).create_order, order)
+
+    def create_orders(self, orders, batch_size=100, concurrency=4):
+        return self._submit(super(AsyncClient, self).create_orders, orders, batch_size, concurrency)
+
+    def delete_order(self, order):
+        return self._submit(super(AsyncClient, self).delete_order, order)
+
+    def get_orders_info(self, orders_dispatch_numbers):
+        return self._submit(super(AsyncClient, self).get_orders_info, orders_dispatch_numbers)
+
+    def get_orders_statuses(self, orders_dispatch_numbers, show_history=True):
+        return self._submit(super(AsyncClient, self).get_orders_statuses, orders_dispatch_numbers, show_history)
+
+    def get_orders_print(self, orders_dispatch_numbers, copy_count=1):
+        return self._submit(super(AsyncClient, self).get_orders_print, orders_dispatch_numbers, copy_count)
+
+    def print_orders(self, orders_dispatch_numbers, output, chunk_size=50, concurrency=4, copy_count=1):
+        return self._submit(super(AsyncClient, self).print_orders, orders_dispatch_numbers, output, chunk_size, concurrency, copy_count)
+
+    def call_courier(self, *args, **kwargs):
+        return self._submit(super(AsyncClient, self).call_courier, *args, **kwargs)
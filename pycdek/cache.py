@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_quote_key(params):
+    """
+    Ключ кеша для параметров запроса к калькулятору
+    Порядок тарифов сохраняется (он задает приоритет), порядок товаров не учитывается
+    :param params: параметры запроса get_shipping_cost
+    :returns str
+    """
+    goods = sorted(
+        sorted((str(name), str(value)) for name, value in item.items())
+        for item in params['goods']
+    )
+    normalized = [
+        params['dateExecute'],
+        str(params['senderCityId']),
+        str(params['receiverCityId']),
+        [str(tariff['id']) for tariff in params['tariffList']],
+        goods,
+    ]
+
+    return 'pycdek:quote:' + hashlib.md5(json.dumps(normalized)).hexdigest()
+
+
+class QuoteCache(object):
+    """ Базовый класс кеша ответов калькулятора стоимости доставки """
+
+    def __init__(self, ttl=3600):
+        """
+        :param ttl: время жизни записи в секундах
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    def get(self, key):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def stats(self):
+        """ Количество попаданий и промахов """
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class MemoryQuoteCache(QuoteCache):
+    """ Кеш в памяти процесса с вытеснением давно неиспользуемых записей (LRU) """
+
+    def __init__(self, ttl=3600, max_entries=10000):
+        """
+        :param max_entries: максимальное количество записей
+        """
+        super(MemoryQuoteCache, self).__init__(ttl)
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+
+            expires, value = item
+            if expires < time.time():
+                return None
+
+            self._data[key] = item
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.ttl, value)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class StoreQuoteCache(QuoteCache):
+    """
+    Кеш во внешнем хранилище, общем для нескольких процессов
+    Хранилище должно поддерживать методы get(key) и set(key, value, timeout), например кеш Django или клиент memcached
+    """
+
+    def __init__(self, store, ttl=3600):
+        """
+        :param store: внешнее хранилище
+        """
+        super(StoreQuoteCache, self).__init__(ttl)
+        self.store = store
+
+    def _get(self, key):
+        return self.store.get(key)
+
+    def _set(self, key, value):
+        self.store.set(key, value, self.ttl)
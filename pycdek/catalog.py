@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import math
+import logging
+import threading
+
+from client import Client
+from snapshot import write_snapshot
+
+logger = logging.getLogger('pycdek')
+
+EARTH_RADIUS = 6371.0
+DEGREE_LENGTH = math.pi * EARTH_RADIUS / 180
+
+
+def distance(latitude1, longitude1, latitude2, longitude2):
+    """ Расстояние между точками в километрах """
+    latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((latitude2 - latitude1) / 2) ** 2 + \
+        math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class CatalogIndex(object):
+    """ Неизменяемый набор индексов по списку пунктов самовывоза """
+
+    def __init__(self, points, cell_size=0.5):
+        self.points = points
+        self.cell_size = cell_size
+        self.by_code = {}
+        self.by_city = {}
+        self.by_postcode = {}
+        self.grid = {}
+
+        for point in points:
+            self.by_code[point['Code']] = point
+            self.by_city.setdefault(str(point['CityCode']), []).append(point)
+            postcode = point.get('PostalCode')
+            if postcode:
+                self.by_postcode.setdefault(str(postcode), []).append(point)
+
+            try:
+                longitude, latitude = float(point['coordX']), float(point['coordY'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.grid.setdefault(self._cell(latitude, longitude), []).append((latitude, longitude, point))
+
+        if self.grid:
+            self.bounds = (
+                min(cell[0] for cell in self.grid), max(cell[0] for cell in self.grid),
+                min(cell[1] for cell in self.grid), max(cell[1] for cell in self.grid),
+            )
+
+    def _cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_size)), int(math.floor(longitude / self.cell_size))
+
+    def _ring(self, center, radius):
+        row, column = center
+        if radius == 0:
+            yield center
+            return
+
+        for i in xrange(-radius, radius + 1):
+            yield row - radius, column + i
+            yield row + radius, column + i
+        for i in xrange(-radius + 1, radius):
+            yield row + i, column - radius
+            yield row + i, column + radius
+
+    def nearest(self, latitude, longitude, limit=1, max_distance=None):
+        if not self.grid:
+            return []
+
+        center = self._cell(latitude, longitude)
+        min_row, max_row, min_column, max_column = self.bounds
+        max_radius = max(abs(center[0] - min_row), abs(center[0] - max_row),
+                         abs(center[1] - min_column), abs(center[1] - max_column))
+        found = []
+
+        for radius in xrange(max_radius + 1):
+            for cell in self._ring(center, radius):
+                for point_latitude, point_longitude, point in self.grid.get(cell, ()):
+                    found.append((distance(latitude, longitude, point_latitude, point_longitude), point))
+
+            # все точки за пределами кольца находятся дальше этой границы
+            gap = radius * self.cell_size
+            bound = gap * DEGREE_LENGTH * math.cos(math.radians(min(89.0, abs(latitude) + gap)))
+            if max_distance is not None and bound > max_distance:
+                break
+            if len(found) >= limit:
+                found.sort(key=lambda item: item[0])
+                del found[limit:]
+                if found[-1][0] <= bound:
+                    break
+
+        found.sort(key=lambda item: item[0])
+        if max_distance is not None:
+            found = [item for item in found if item[0] <= max_distance]
+
+        return found[:limit]
+
+
+class DeliveryPointCatalog(object):
+    """
+    Каталог пунктов самовывоза в памяти с индексами по коду, городу, почтовому индексу и координатам.
+    Загружается один раз через get_delivery_points и может обновляться в фоновом потоке,
+    новые данные подменяют старые атомарно.
+    """
+
+    def __init__(self, client=Client, refresh_interval=None, cell_size=0.5):
+        """
+        :param client: класс или экземпляр Client
+        :param refresh_interval: период фонового обновления в секундах
+        :param cell_size: размер ячейки пространственного индекса в градусах
+        """
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.cell_size = cell_size
+        self._index = None
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _build_index(self):
+        return CatalogIndex(self.client.get_delivery_points(), self.cell_size)
+
+    def load(self):
+        """ Загрузить список пунктов и перестроить индексы """
+        with self._load_lock:
+            self._index = self._build_index()
+
+        return self._index
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._load_lock:
+                if self._index is None:
+                    self._index = self._build_index()
+
+        return self._index
+
+    def __len__(self):
+        return len(self.index.points)
+
+    def __iter__(self):
+        return iter(self.index.points)
+
+    def get(self, code):
+        """
+        Пункт самовывоза по коду
+        :param code: код пункта
+        """
+        return self.index.by_code.get(code)
+
+    def get_city_points(self, city_id):
+        """
+        Пункты самовывоза в городе
+        :param city_id: ID города по базе СДЭК
+        :returns list
+        """
+        return self.index.by_city.get(str(city_id), [])
+
+    def get_postcode_points(self, postcode):
+        """
+        Пункты самовывоза по почтовому индексу
+        :param postcode: почтовый индекс
+        :returns list
+        """
+        return self.index.by_postcode.get(str(postcode), [])
+
+    def get_nearest_points(self, latitude, longitude, limit=1, max_distance=None):
+        """
+        Ближайшие к точке пункты самовывоза
+        :param latitude: широта
+        :param longitude: долгота
+        :param limit: количество пунктов
+        :param max_distance: максимальное расстояние в километрах
+        :returns list of (расстояние в километрах, пункт)
+        """
+        return self.index.nearest(latitude, longitude, limit, max_distance)
+
+    def save_snapshot(self, path):
+        """
+        Сохранить каталог в бинарный файл для DeliveryPointSnapshot
+        :param path: путь к файлу
+        """
+        write_snapshot(self.index.points, path)
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.load()
+            except Exception:
+                logger.exception('Delivery points refresh failed')
+
+    def start(self):
+        """ Запустить фоновое обновление каталога """
+        if self.refresh_interval is None:
+            raise ValueError('refresh_interval is not set')
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name='pycdek-catalog-refresh')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Остановить фоновое обновление каталога """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,13 +1,34 @@
 # -*- coding: utf-8 -*-
+import os
 import json
-import hashlib
+import time
+import shutil
 import datetime
 import urllib2
-import StringIO
+import itertools
+from functools import partial
 from urllib import urlencode
+from collections import namedtuple
 from xml.etree import ElementTree
 from abc import ABCMeta, abstractmethod
 
+from cache import make_quote_key
+from metrics import NULL_TIMER, Metrics, Timer, get_endpoint
+from policy import RequestPolicy
+from records import OrderStatus, Pvz
+from signing import Signer
+from transport import NETWORK_ERRORS, UrllibTransport
+from utils import chunks, hybridmethod, parallel_map
+from xmlwriter import ElementTemplate, XmlWriter, make_document
+
+CreateOrderResult = namedtuple('CreateOrderResult', ['order', 'response', 'error'])
+OrderLineData = namedtuple('OrderLineData', ['title', 'upc', 'weight', 'quantity', 'price', 'payment'])
+PrintResult = namedtuple('PrintResult', ['orders_dispatch_numbers', 'output', 'error'])
+
+ORDER_NUMBER_TEMPLATE = ElementTemplate('Order', 'Number')
+ORDER_DISPATCH_NUMBER_TEMPLATE = ElementTemplate('Order', 'DispatchNumber')
+ITEM_TEMPLATE = ElementTemplate('Item', 'Amount', 'Weight', 'WareKey', 'Cost', 'Payment')
+
 
 class AbstractOrder(object):
     __metaclass__ = ABCMeta
@@ -72,6 +93,34 @@ class AbstractOrder(object):
         """ Дополнительные инструкции для доставки """
         return ''
 
+    def get_products_data(self):
+        """
+        Данные всех товаров заказа, список OrderLineData
+        По умолчанию собираются через get_products() и методы AbstractOrderLine,
+        переопределите, чтобы получить все данные одним запросом
+        """
+        return [
+            OrderLineData(
+                title=product.get_product_title(),
+                upc=product.get_product_upc(),
+                weight=product.get_product_weight(),
+                quantity=product.get_quantity(),
+                price=product.get_product_price(),
+                payment=product.get_product_payment(),
+            )
+            for product in self.get_products()
+        ]
+
+    @classmethod
+    def load_products_data(cls, orders):
+        """
+        Данные товаров нескольких заказов этого класса для массового создания заказов
+        Переопределите, чтобы загрузить товары всех заказов одним запросом
+        :param orders: список заказов
+        :returns list списков OrderLineData в порядке заказов
+        """
+        return [order.get_products_data() for order in orders]
+
 
 class AbstractOrderLine(object):
     __metaclass__ = ABCMeta
@@ -112,21 +161,145 @@ class Client(object):
     DELIVERY_POINTS_URL = INTEGRATOR_URL + '/pvzlist.php'
     CALL_COURIER_URL = INTEGRATOR_URL + '/call_courier.php'
     array_tags = {'State', 'Delay', 'Good', 'Fail', 'Item', 'Package'}
-
-    def __init__(self, login, password):
+    transport = UrllibTransport()
+    quote_cache = None
+    typed_results = False
+    default_policy = RequestPolicy()
+    idempotent_policy = RequestPolicy(retries=2)
+    policies = {}
+    circuit_breaker = None
+    rate_limiter = None
+    concurrency_limiter = None
+    metrics = Metrics()
+
+    def __init__(self, login, password, transport=None, quote_cache=None, typed_results=False,
+                 policies=None, circuit_breaker=None, rate_limiter=None, concurrency_limiter=None, metrics=None,
+                 clock=None):
+        """
+        :param login: логин
+        :param password: пароль
+        :param transport: экземпляр класса Transport, по умолчанию UrllibTransport
+        :param quote_cache: экземпляр класса QuoteCache для кеширования расчетов стоимости доставки
+        :param typed_results: возвращать пункты самовывоза и статусы заказов в виде записей Pvz и OrderStatus вместо словарей
+        :param policies: словарь {адрес API: RequestPolicy} с таймаутами и повторами для отдельных адресов
+        :param circuit_breaker: экземпляр CircuitBreaker
+        :param rate_limiter: экземпляр RateLimiter
+        :param concurrency_limiter: экземпляр ConcurrencyLimiter
+        :param metrics: экземпляр Metrics для замеров времени, размеров и ошибок запросов
+        :param clock: функция, возвращающая дату запроса строкой, для подписи запросов (см. Signer)
+        """
         self._login = login
         self._password = password
+        self.signer = Signer(login, password, clock)
+        if transport is not None:
+            self.transport = transport
+        if quote_cache is not None:
+            self.quote_cache = quote_cache
+        if typed_results:
+            self.typed_results = typed_results
+        if policies is not None:
+            self.policies = policies
+        if circuit_breaker is not None:
+            self.circuit_breaker = circuit_breaker
+        if rate_limiter is not None:
+            self.rate_limiter = rate_limiter
+        if concurrency_limiter is not None:
+            self.concurrency_limiter = concurrency_limiter
+        if metrics is not None:
+            self.metrics = metrics
+
+    @hybridmethod
+    def _measure(cls, url, stage):
+        if not cls.metrics.enabled:
+            return NULL_TIMER
+
+        return Timer(cls.metrics, get_endpoint(url), stage)
 
     @classmethod
-    def _exec_request(cls, url, data, method='GET'):
+    def _prepare_request(cls, url, data, method):
         if method == 'GET':
-            request = urllib2.Request(url + '?' + urlencode(data))
+            return url + '?' + urlencode(data), None
         elif method == 'POST':
-            request = urllib2.Request(url, data=data)
+            return url, data
         else:
             raise NotImplementedError('Unknown method "%s"' % method)
 
-        return urllib2.urlopen(request).read()
+    @hybridmethod
+    def _get_policy(cls, url):
+        if url in cls.policies:
+            return cls.policies[url]
+
+        # повтор запросов на чтение безопасен, создание заказов и вызов курьера не повторяются,
+        # PooledTransport повторно отправляет их только если сервер не мог получить запрос целиком
+        if url in (cls.CALCULATOR_URL, cls.ORDER_STATUS_URL, cls.ORDER_INFO_URL, cls.DELIVERY_POINTS_URL):
+            return cls.idempotent_policy
+
+        return cls.default_policy
+
+    @hybridmethod
+    def _send(cls, url, data, method, func):
+        policy = cls._get_policy(url)
+        metrics = cls.metrics if cls.metrics.enabled else None
+        endpoint = get_endpoint(url)
+        url, data = cls._prepare_request(url, data, method)
+        attempt = 0
+
+        while True:
+            if cls.rate_limiter is not None:
+                cls.rate_limiter.acquire()
+            if cls.circuit_breaker is not None:
+                cls.circuit_breaker.before_request()
+
+            if metrics is not None and data:
+                metrics.size(endpoint, 'request', len(data))
+
+            try:
+                if cls.concurrency_limiter is not None:
+                    with cls.concurrency_limiter, cls._measure(endpoint, 'network'):
+                        response = func(url, data, method, policy.timeout)
+                else:
+                    with cls._measure(endpoint, 'network'):
+                        response = func(url, data, method, policy.timeout)
+            except urllib2.HTTPError as e:
+                if metrics is not None:
+                    metrics.error(endpoint, e)
+                if e.code < 500:
+                    if cls.circuit_breaker is not None:
+                        cls.circuit_breaker.record_success()
+                    raise
+                error = e
+            except NETWORK_ERRORS as e:
+                if metrics is not None:
+                    metrics.error(endpoint, e)
+                error = e
+            except Exception:
+                # прочие ошибки (например, ssl.CertificateError) не повторяются,
+                # но засчитываются прерывателю, иначе пробный запрос не завершится
+                if cls.circuit_breaker is not None:
+                    cls.circuit_breaker.record_failure()
+                raise
+            else:
+                if cls.circuit_breaker is not None:
+                    cls.circuit_breaker.record_success()
+                if metrics is not None and isinstance(response, str):
+                    metrics.size(endpoint, 'response', len(response))
+                return response
+
+            if cls.circuit_breaker is not None:
+                cls.circuit_breaker.record_failure()
+            if attempt >= policy.retries:
+                raise error
+
+            time.sleep(policy.get_delay(attempt))
+            attempt += 1
+
+    @hybridmethod
+    def _exec_request(cls, url, data, method='GET'):
+        return cls._send(url, data, method, cls.transport.request)
+
+    @hybridmethod
+    def _open_request(cls, url, data, method='GET'):
+        return cls._send(url, data, method, cls.transport.open)
 
     @classmethod
     def _parse_xml(cls, data):
@@ -137,6 +310,41 @@ class Client(object):
         else:
             return xml
 
+    @hybridmethod
+    def _convert(cls, xml, record_class):
+        if cls.typed_results:
+            return record_class.from_xml(xml)
+
+        return cls._xml_to_dict(xml)
+
+    @hybridmethod
+    def _iter_xml(cls, response, tag, record_class):
+        """
+        Потоковый разбор ответа, возвращает по одному элементу tag верхнего уровня
+        Обработанные элементы удаляются из дерева, поэтому память не растет с размером ответа
+        """
+        root = None
+        depth = 0
+        try:
+            for event, element in ElementTree.iterparse(response, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if depth == 1 and element.tag == tag:
+                    result = cls._convert(element, record_class)
+                    if isinstance(result, dict):
+                        # словарь - это attrib элемента, который будет очищен
+                        result = dict(result)
+                    element.clear()
+                    root.clear()
+                    yield result
+        finally:
+            response.close()
+
     @classmethod
     def _xml_to_dict(cls, xml):
         result = xml.attrib
@@ -150,7 +358,7 @@ class Client(object):
 
         return result
 
-    @classmethod
+    @hybridmethod
     def get_shipping_cost(cls, sender_city_id, receiver_city_id, tariffs, goods):
         """
         Возвращает информацию о стоимости и сроках доставки
@@ -170,9 +378,22 @@ class Client(object):
             'goods': goods,
         }
 
-        return json.loads(cls._exec_request(cls.CALCULATOR_URL, json.dumps(params), 'POST'))
+        cache_key = None
+        if cls.quote_cache is not None:
+            cache_key = make_quote_key(params)
+            response = cls.quote_cache.get(cache_key)
+            if response is not None:
+                return json.loads(response)
 
-    @classmethod
+        response = cls._exec_request(cls.CALCULATOR_URL, json.dumps(params), 'POST')
+        with cls._measure(cls.CALCULATOR_URL, 'parse'):
+            result = json.loads(response)
+        if cache_key is not None and 'error' not in result:
+            cls.quote_cache.set(cache_key, response)
+
+        return result
+
+    @hybridmethod
     def get_delivery_points(cls, city_id=None):
         """
         Возвращает списков пунктов самовывоза для указанного города, либо для всех если город не указан
@@ -180,27 +401,123 @@ class Client(object):
         :returns list
         """
         response = cls._exec_request(cls.DELIVERY_POINTS_URL, {'cityid': city_id} if city_id else {})
-        xml = cls._parse_xml(response)
+        with cls._measure(cls.DELIVERY_POINTS_URL, 'parse'):
+            xml = cls._parse_xml(response)
+
+        with cls._measure(cls.DELIVERY_POINTS_URL, 'convert'):
+            return [cls._convert(point, Pvz) for point in xml.findall('Pvz')]
+
+    @hybridmethod
+    def iter_delivery_points(cls, city_id=None):
+        """
+        Потоковый вариант get_delivery_points, ответ читается и разбирается по мере получения
+        :param city_id: ID города по базе СДЭК
+        :returns генератор пунктов самовывоза
+        """
+        response = cls._open_request(cls.DELIVERY_POINTS_URL, {'cityid': city_id} if city_id else {})
+        return cls._iter_xml(response, 'Pvz', Pvz)
 
-        return [cls._xml_to_dict(point) for point in xml.findall('Pvz')]
+    def _prepare_xml_request(self, url, tag, attrib, body=''):
+        """
+        Подготовить тело POST запроса
+        :param body: дочерние элементы корневого элемента либо функция без аргументов, которая их записывает,
+                     чтобы сборка запроса входила в этап serialize. Функция может дополнить attrib
+                     или вернуть None, если отправлять нечего, тогда возвращается None
+        """
+        with self._measure(url, 'sign'):
+            self.signer.sign(attrib)
 
-    def _xml_to_string(self, xml):
-        buff = StringIO.StringIO()
-        ElementTree.ElementTree(xml).write(buff, encoding='UTF-8', xml_declaration=False)
+        with self._measure(url, 'serialize'):
+            if callable(body):
+                body = body()
+                if body is None:
+                    return None
+            return urlencode({'xml_request': make_document(tag, attrib, body)})
+
+    def _prepare_xml_requests(self, url, tag, requests):
+        """
+        Подготовить несколько запросов с общей подписью
+        :param requests: список пар (атрибуты, тело запроса или функция, которая его записывает)
+        :returns list тел POST запросов
+        """
+        with self._measure(url, 'sign'):
+            self.signer.sign_many([attrib for attrib, _ in requests])
 
-        return '<?xml version="1.0" encoding="UTF-8" ?>' + buff.getvalue()
+        with self._measure(url, 'serialize'):
+            return [urlencode({'xml_request': make_document(tag, attrib, body() if callable(body) else body)})
+                    for attrib, body in requests]
 
-    def _exec_xml_request(self, url, xml_element):
-        date = datetime.datetime.now().isoformat()
-        xml_element.attrib['Date'] = date
-        xml_element.attrib['Account'] = self._login
-        xml_element.attrib['Secure'] = self._make_secure(date)
+    def _exec_xml_request(self, url, tag, attrib, body=''):
+        data = self._prepare_xml_request(url, tag, attrib, body)
+        if data is None:
+            return None
 
-        response = self._exec_request(url, urlencode({'xml_request': self._xml_to_string(xml_element)}), method='POST')
-        return self._parse_xml(response)
+        response = self._exec_request(url, data, method='POST')
+        with self._measure(url, 'parse'):
+            return self._parse_xml(response)
 
     def _make_secure(self, date):
-        return hashlib.md5('%s&%s' % (date, self._password)).hexdigest()
+        return self.signer.get_secure(date)
+
+    def _load_products_data(self, orders):
+        products_data = [None] * len(orders)
+        indexes_by_class = {}
+        for i, order in enumerate(orders):
+            indexes_by_class.setdefault(type(order), []).append(i)
+
+        for order_class, indexes in indexes_by_class.items():
+            for i, order_products_data in zip(indexes, order_class.load_products_data([orders[i] for i in indexes])):
+                products_data[i] = order_products_data
+
+        return products_data
+
+    def _write_order(self, writer, order, products_data):
+        number = order.get_number()
+        writer.start('Order', {
+            'Number': str(number),
+            'SendCityCode': str(order.get_sender_city_id()),
+            'SendCityPostCode': str(order.get_sender_postcode()),
+            'RecCityCode': str(order.get_recipient_city_id()),
+            'RecCityPostCode': str(order.get_recipient_postcode()),
+            'RecipientName': order.get_recipient_name(),
+            'TariffTypeCode': str(order.get_shipping_tariff()),
+            'DeliveryRecipientCost': str(order.get_shipping_price()),
+            'Phone': str(order.get_recipient_phone()),
+            'Comment': order.get_comment(),
+        })
+
+        if order.get_pvz_code():
+            writer.element('Address', {'PvzCode': order.get_pvz_code()})
+        else:
+            writer.element('Address', {
+                'Street': order.get_recipient_address_street(),
+                'House': str(order.get_recipient_address_house()),
+                'Flat': str(order.get_recipient_address_flat()),
+            })
+
+        items = []
+        total_weight = 0
+
+        for product in products_data:
+            items.append(ITEM_TEMPLATE.render(
+                Amount=str(product.quantity),
+                Weight=str(product.weight),
+                WareKey=str(product.upc)[:30],
+                Cost=str(product.price),
+                Payment=str(product.payment),
+            ))
+
+            total_weight += product.weight
+
+        package_attrib = {'Number': '%s1' % number, 'BarCode': '%s1' % number, 'Weight': str(total_weight)}
+        if items:
+            writer.start('Package', package_attrib)
+            map(writer.write, items)
+            writer.end('Package')
+        else:
+            writer.element('Package', package_attrib)
+
+        writer.end('Order')
 
     def create_order(self, order):
         """
@@ -208,44 +525,87 @@ class Client(object):
         :param order: экземпляр класса AbstractOrder
         :returns dict
         """
-        delivery_request_element = ElementTree.Element('DeliveryRequest', Number=str(order.get_number()), OrderCount='1')
-
-        order_element = ElementTree.SubElement(delivery_request_element, 'Order')
-        order_element.attrib['Number'] = str(order.get_number())
-        order_element.attrib['SendCityCode'] = str(order.get_sender_city_id())
-        order_element.attrib['SendCityPostCode'] = str(order.get_sender_postcode())
-        order_element.attrib['RecCityCode'] = str(order.get_recipient_city_id())
-        order_element.attrib['RecCityPostCode'] = str(order.get_recipient_postcode())
-        order_element.attrib['RecipientName'] = order.get_recipient_name()
-        order_element.attrib['TariffTypeCode'] = str(order.get_shipping_tariff())
-        order_element.attrib['DeliveryRecipientCost'] = str(order.get_shipping_price())
-        order_element.attrib['Phone'] = str(order.get_recipient_phone())
-        order_element.attrib['Comment'] = order.get_comment()
-
-        address_element = ElementTree.SubElement(order_element, 'Address')
-        if order.get_pvz_code():
-            address_element.attrib['PvzCode'] = order.get_pvz_code()
-        else:
-            address_element.attrib['Street'] = order.get_recipient_address_street()
-            address_element.attrib['House'] = str(order.get_recipient_address_house())
-            address_element.attrib['Flat'] = str(order.get_recipient_address_flat())
+        products_data = order.get_products_data()
 
-        package_element = ElementTree.SubElement(order_element, 'Package', Number='%s1' % order.get_number(), BarCode='%s1' % order.get_number())
-        total_weight = 0
+        def write():
+            writer = XmlWriter()
+            self._write_order(writer, order, products_data)
+            return writer.getvalue()
 
-        for product in order.get_products():
-            item_element = ElementTree.SubElement(package_element, 'Item', Amount=str(product.get_quantity()))
-            item_element.attrib['Weight'] = str(product.get_product_weight())
-            item_element.attrib['WareKey'] = str(product.get_product_upc())[:30]
-            item_element.attrib['Cost'] = str(product.get_product_price())
-            item_element.attrib['Payment'] = str(product.get_product_payment())
+        xml = self._exec_xml_request(self.CREATE_ORDER_URL, 'DeliveryRequest', {
+            'Number': str(order.get_number()),
+            'OrderCount': '1',
+        }, write)
+        return self._xml_to_dict(xml.find('Order'))
 
-            total_weight += product.get_product_weight()
+    def _create_orders_batch(self, batch):
+        results = [None] * len(batch)
+        indexes = []
+        numbers = []
+        attrib = {}
+
+        def write():
+            writer = XmlWriter()
+            for i, (order, products_data) in enumerate(batch):
+                size = len(writer)
+                try:
+                    number = str(order.get_number())
+                    self._write_order(writer, order, products_data)
+                except Exception as e:
+                    # заказ, который не удалось записать, не отправляется, остальные заказы пачки отправляются
+                    writer.truncate(size)
+                    results[i] = CreateOrderResult(order, None, e)
+                else:
+                    indexes.append(i)
+                    numbers.append(number)
+
+            if not indexes:
+                return None
+
+            attrib['Number'] = numbers[0] if len(numbers) == 1 else '%s-%s' % (numbers[0], numbers[-1])
+            attrib['OrderCount'] = str(len(numbers))
+            return writer.getvalue()
+
+        try:
+            xml = self._exec_xml_request(self.CREATE_ORDER_URL, 'DeliveryRequest', attrib, write)
+        except Exception as e:
+            xml, common_error = None, e
+        else:
+            common_error = 'ERR_INVALID_RESPONSE' if xml is None else 'ERR_NO_RESPONSE'
+
+        responses = {}
+        for order_element in (xml.findall('Order') if xml is not None else ()):
+            response = self._xml_to_dict(order_element)
+            if 'Number' in response:
+                responses[response['Number']] = response
+            elif 'ErrorCode' in response:
+                common_error = response['ErrorCode']
+
+        for i, number in itertools.izip(indexes, numbers):
+            order = batch[i][0]
+            response = responses.get(number)
+            if response is None:
+                results[i] = CreateOrderResult(order, None, common_error)
+            else:
+                results[i] = CreateOrderResult(order, response, response.get('ErrorCode'))
 
-        package_element.attrib['Weight'] = str(total_weight)
+        return results
 
-        xml = self._exec_xml_request(self.CREATE_ORDER_URL, delivery_request_element)
-        return self._xml_to_dict(xml.find('Order'))
+    def create_orders(self, orders, batch_size=100, concurrency=4):
+        """
+        Создать несколько заказов, по batch_size заказов в одном запросе
+        :param orders: список экземпляров класса AbstractOrder
+        :param batch_size: количество заказов в одном запросе
+        :param concurrency: количество одновременно выполняемых запросов
+        :returns list of CreateOrderResult(order, response, error) в порядке исходных заказов,
+                 error - код ошибки СДЭК, исключение при записи заказа (заказ не отправлен) или при запросе,
+                 None если заказ создан
+                 (ERR_NO_RESPONSE - заказа нет в ответе, ERR_INVALID_RESPONSE - ответ не разобран)
+        """
+        orders = list(orders)
+        # данные товаров загружаются в вызывающем потоке, по одному вызову load_products_data на класс заказов
+        batches = chunks(zip(orders, self._load_products_data(orders)), batch_size)
+        return list(itertools.chain.from_iterable(parallel_map(self._create_orders_batch, batches, concurrency)))
 
     def delete_order(self, order):
         """
@@ -253,10 +613,12 @@ class Client(object):
         :param order: экземпляр класса AbstractOrder
         :returns dict
         """
-        delete_request_element = ElementTree.Element('DeleteRequest', Number=str(order.get_number()), OrderCount='1')
-        ElementTree.SubElement(delete_request_element, 'Order', Number=str(order.get_number()))
+        number = str(order.get_number())
 
-        xml = self._exec_xml_request(self.DELETE_ORDER_URL, delete_request_element)
+        xml = self._exec_xml_request(self.DELETE_ORDER_URL, 'DeleteRequest', {
+            'Number': number,
+            'OrderCount': '1',
+        }, ORDER_NUMBER_TEMPLATE.render(Number=number))
         return self._xml_to_dict(xml.find('DeleteRequest'))
 
     def get_orders_info(self, orders_dispatch_numbers):
@@ -265,13 +627,19 @@ class Client(object):
         :param orders_dispatch_numbers: список номеров отправлений СДЭК
         :returns list
         """
-        info_request = ElementTree.Element('InfoRequest')
-        for dispatch_number in orders_dispatch_numbers:
-            ElementTree.SubElement(info_request, 'Order', DispatchNumber=str(dispatch_number))
-
-        xml = self._exec_xml_request(self.ORDER_INFO_URL, info_request)
+        xml = self._exec_xml_request(self.ORDER_INFO_URL, 'InfoRequest', {},
+                                     partial(self._write_dispatch_numbers, orders_dispatch_numbers))
         return [self._xml_to_dict(order) for order in xml.findall('Order')]
 
+    def _write_dispatch_numbers(self, orders_dispatch_numbers):
+        return ''.join([ORDER_DISPATCH_NUMBER_TEMPLATE.render(DispatchNumber=str(dispatch_number))
+                        for dispatch_number in orders_dispatch_numbers])
+
+    def _prepare_status_report(self, orders_dispatch_numbers, show_history):
+        return self._prepare_xml_request(self.ORDER_STATUS_URL, 'StatusReport', {
+            'ShowHistory': str(int(show_history)),
+        }, partial(self._write_dispatch_numbers, orders_dispatch_numbers))
+
     def get_orders_statuses(self, orders_dispatch_numbers, show_history=True):
         """
         Статусы заказовx
@@ -279,12 +647,22 @@ class Client(object):
         :param show_history: получать историю статусов
         :returns list
         """
-        status_report_element = ElementTree.Element('StatusReport', ShowHistory=str(int(show_history)))
-        for dispatch_number in orders_dispatch_numbers:
-            ElementTree.SubElement(status_report_element, 'Order', DispatchNumber=str(dispatch_number))
+        response = self._exec_request(self.ORDER_STATUS_URL, self._prepare_status_report(orders_dispatch_numbers, show_history), method='POST')
+        with self._measure(self.ORDER_STATUS_URL, 'parse'):
+            xml = self._parse_xml(response)
 
-        xml = self._exec_xml_request(self.ORDER_STATUS_URL, status_report_element)
-        return [self._xml_to_dict(order) for order in xml.findall('Order')]
+        with self._measure(self.ORDER_STATUS_URL, 'convert'):
+            return [self._convert(order, OrderStatus) for order in xml.findall('Order')]
+
+    def iter_orders_statuses(self, orders_dispatch_numbers, show_history=True):
+        """
+        Потоковый вариант get_orders_statuses, ответ читается и разбирается по мере получения
+        :param orders_dispatch_numbers: список номеров отправлений СДЭК
+        :param show_history: получать историю статусов
+        :returns генератор статусов заказов
+        """
+        response = self._open_request(self.ORDER_STATUS_URL, self._prepare_status_report(orders_dispatch_numbers, show_history), method='POST')
+        return self._iter_xml(response, 'Order', OrderStatus)
 
     def get_orders_print(self, orders_dispatch_numbers, copy_count=1):
         """
@@ -292,16 +670,80 @@ class Client(object):
         :param orders_dispatch_numbers: список номеров отправлений СДЭК
         :param copy_count: количество копий
         """
-        date = datetime.datetime.now().isoformat()
-        orders_print_element = ElementTree.Element('OrdersPrint', OrderCount=str(len(orders_dispatch_numbers)), CopyCount=str(copy_count), Date=date, Account=self._login, Secure=self._make_secure(date))
-
-        for dispatch_number in orders_dispatch_numbers:
-            ElementTree.SubElement(orders_print_element, 'Order', DispatchNumber=str(dispatch_number))
+        data = self._prepare_xml_request(self.ORDER_PRINT_URL, 'OrdersPrint', {
+            'OrderCount': str(len(orders_dispatch_numbers)),
+            'CopyCount': str(copy_count),
+        }, partial(self._write_dispatch_numbers, orders_dispatch_numbers))
 
-        response = self._exec_request(self.ORDER_PRINT_URL, urlencode({'xml_request': self._xml_to_string(orders_print_element)}), method='POST')
+        response = self._exec_request(self.ORDER_PRINT_URL, data, method='POST')
 
         return response if not response.startswith('<?xml') else None
 
+    def _print_chunk(self, task):
+        index, orders_dispatch_numbers, data, output = task
+        try:
+            response = self._open_request(self.ORDER_PRINT_URL, data, method='POST')
+        except NETWORK_ERRORS as e:
+            return PrintResult(orders_dispatch_numbers, None, e)
+
+        path = None
+        try:
+            head = response.read(5)
+            if head == '<?xml':
+                # вместо PDF вернулась ошибка
+                xml = self._parse_xml(head + response.read())
+                errors = [element.attrib['ErrorCode'] for element in xml.iter() if 'ErrorCode' in element.attrib] if xml is not None else []
+                return PrintResult(orders_dispatch_numbers, None, errors[0] if errors else 'ERR_INVALID_RESPONSE')
+
+            if callable(output):
+                stream = output(index, orders_dispatch_numbers)
+            else:
+                stream = open(output.format(index=index, first=orders_dispatch_numbers[0]), 'wb')
+                path = stream.name
+
+            try:
+                stream.write(head)
+                shutil.copyfileobj(response, stream, 65536)
+            finally:
+                if path is not None:
+                    stream.close()
+
+            return PrintResult(orders_dispatch_numbers, path or stream, None)
+        except Exception as e:
+            if path is not None:
+                # недописанный PDF удаляется
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return PrintResult(orders_dispatch_numbers, None, e)
+        finally:
+            response.close()
+
+    def print_orders(self, orders_dispatch_numbers, output, chunk_size=50, concurrency=4, copy_count=1):
+        """
+        Печатные формы квитанций к заказам, по chunk_size заказов в одном файле
+        PDF записывается в файл по мере получения, не загружаясь в память целиком
+        :param orders_dispatch_numbers: список номеров отправлений СДЭК
+        :param output: шаблон пути к файлу с полями {index} и {first} (номер части и первый номер отправления),
+                       либо функция (номер части, номера отправлений), возвращающая объект с методом write
+        :param chunk_size: количество заказов в одном запросе
+        :param concurrency: количество одновременно выполняемых запросов
+        :param copy_count: количество копий
+        :returns list of PrintResult(orders_dispatch_numbers, output, error) по частям,
+                 output - путь к файлу или объект, в который записан PDF,
+                 error - код ошибки СДЭК или исключение сети, записи файла или output, None если квитанции получены,
+                 файл части, при записи которой произошла ошибка, удаляется
+        """
+        parts = chunks(orders_dispatch_numbers, chunk_size)
+        # все части подписываются одной датой, подпись не пересчитывается в рабочих потоках
+        requests = self._prepare_xml_requests(self.ORDER_PRINT_URL, 'OrdersPrint', [
+            ({'OrderCount': str(len(part)), 'CopyCount': str(copy_count)}, partial(self._write_dispatch_numbers, part))
+            for part in parts
+        ])
+        tasks = [(index, part, data, output) for index, (part, data) in enumerate(zip(parts, requests))]
+        return parallel_map(self._print_chunk, tasks, concurrency)
+
     def call_courier(self, date, time_begin, time_end, sender_city_id, sender_phone, sender_name, weight, address_street, address_house, address_flat, comment='', lunch_begin=None, lunch_end=None):
         """
         Вызов курьера
@@ -317,22 +759,28 @@ class Client(object):
         :param lunch_end: время окончания обеда
         :returns bool
         """
-        call_courier_element = ElementTree.Element('CallCourier', CallCount='1')
-        call_element = ElementTree.SubElement(call_courier_element, 'Call', Date=date.isoformat(), TimeBeg=time_begin.isoformat(), TimeEnd=time_end.isoformat())
-        call_element.attrib['SendCityCode'] = str(sender_city_id)
-        call_element.attrib['SendPhone'] = str(sender_phone)
-        call_element.attrib['SenderName'] = sender_name
-        call_element.attrib['Weight'] = str(weight)
-        call_element.attrib['Comment'] = comment
+        call_attrib = {
+            'Date': date.isoformat(),
+            'TimeBeg': time_begin.isoformat(),
+            'TimeEnd': time_end.isoformat(),
+            'SendCityCode': str(sender_city_id),
+            'SendPhone': str(sender_phone),
+            'SenderName': sender_name,
+            'Weight': str(weight),
+            'Comment': comment,
+        }
         if lunch_begin:
-            call_element.attrib['LunchBeg'] = lunch_begin.isoformat()
+            call_attrib['LunchBeg'] = lunch_begin.isoformat()
         if lunch_end:
-            call_element.attrib['LunchEnd'] = lunch_end.isoformat()
+            call_attrib['LunchEnd'] = lunch_end.isoformat()
 
-        ElementTree.SubElement(call_element, 'Address', Street=address_street, House=str(address_house), Flat=str(address_flat))
+        writer = XmlWriter()
+        writer.start('Call', call_attrib)
+        writer.element('Address', {'Street': address_street, 'House': str(address_house), 'Flat': str(address_flat)})
+        writer.end('Call')
 
         try:
-            self._exec_xml_request(self.CALL_COURIER_URL, call_courier_element)
+            self._exec_xml_request(self.CALL_COURIER_URL, 'CallCourier', {'CallCount': '1'}, writer.getvalue())
         except urllib2.HTTPError:
             return False
         else:
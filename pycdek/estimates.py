@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import os
+import bisect
+import marshal
+import tempfile
+import threading
+from collections import namedtuple
+
+from client import Client
+from utils import get_file_mode
+
+Estimate = namedtuple('Estimate', ['price_min', 'price_max', 'period_min', 'period_max', 'samples', 'confident'])
+
+
+class TariffEstimator(object):
+    """
+    Приблизительная стоимость доставки по накопленным ответам калькулятора
+    Ответы сводятся в таблицу по маршруту, тарифу и весовой категории, таблица сохраняется на диск
+    и загружается целиком, оценка - это поиск в словаре без запросов к API.
+    """
+    FORMAT_VERSION = 1
+    weight_brackets = (0.5, 1, 2, 3, 5, 10, 15, 20, 30, 50, 100)
+
+    def __init__(self, client=Client, min_samples=3, max_spread=0.2):
+        """
+        :param client: класс или экземпляр Client для запросов, когда оценки нет
+        :param min_samples: минимальное количество ответов для уверенной оценки
+        :param max_spread: максимальный разброс цен в категории для уверенной оценки, доля от максимальной цены
+        """
+        self.client = client
+        self.min_samples = min_samples
+        self.max_spread = max_spread
+        # (отправитель, получатель, тариф, категория) -> (мин. цена, макс. цена, мин. срок, макс. срок, количество)
+        self._table = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._table)
+
+    def get_bracket(self, weight):
+        """ Индекс весовой категории для веса в килограммах """
+        return bisect.bisect_left(self.weight_brackets, weight)
+
+    def _key(self, sender_city_id, receiver_city_id, tariff, weight):
+        return int(sender_city_id), int(receiver_city_id), int(tariff), self.get_bracket(weight)
+
+    @staticmethod
+    def get_goods_weight(goods):
+        return sum(float(item['weight']) for item in goods)
+
+    def learn(self, sender_city_id, receiver_city_id, tariff, weight, response):
+        """
+        Учесть ответ калькулятора
+        :param weight: общий вес в килограммах
+        :param response: ответ get_shipping_cost
+        :returns True, если ответ содержит стоимость и был учтен
+        """
+        result = response.get('result')
+        if not result or int(result.get('tariffId', tariff)) != int(tariff):
+            return False
+
+        price = float(result['price'])
+        period_min = int(result.get('deliveryPeriodMin') or 0)
+        period_max = int(result.get('deliveryPeriodMax') or period_min)
+        key = self._key(sender_city_id, receiver_city_id, tariff, weight)
+
+        with self._lock:
+            row = self._table.get(key)
+            if row is None:
+                self._table[key] = (price, price, period_min, period_max, 1)
+            else:
+                self._table[key] = (min(row[0], price), max(row[1], price), min(row[2], period_min), max(row[3], period_max), row[4] + 1)
+
+        return True
+
+    def estimate(self, sender_city_id, receiver_city_id, tariff, weight):
+        """
+        Оценка стоимости и сроков доставки
+        :param weight: общий вес в килограммах
+        :returns Estimate или None, если по маршруту, тарифу и весовой категории нет данных
+        """
+        row = self._table.get(self._key(sender_city_id, receiver_city_id, tariff, weight))
+        if row is None:
+            return None
+
+        price_min, price_max, period_min, period_max, samples = row
+        confident = samples >= self.min_samples and price_max - price_min <= price_max * self.max_spread
+
+        return Estimate(price_min, price_max, period_min, period_max, samples, confident)
+
+    def get_shipping_estimate(self, sender_city_id, receiver_city_id, tariff, goods):
+        """
+        Уверенная оценка из таблицы, либо точный расчет через get_shipping_cost, если такой оценки нет
+        :param goods: список товаров в формате get_shipping_cost
+        :returns Estimate или None, если тариф недоступен
+        """
+        weight = self.get_goods_weight(goods)
+        estimate = self.estimate(sender_city_id, receiver_city_id, tariff, weight)
+        if estimate is not None and estimate.confident:
+            return estimate
+
+        response = self.client.get_shipping_cost(sender_city_id, receiver_city_id, [tariff], goods)
+        if not self.learn(sender_city_id, receiver_city_id, tariff, weight, response):
+            return None
+
+        result = response['result']
+        price = float(result['price'])
+        period_min = int(result.get('deliveryPeriodMin') or 0)
+        period_max = int(result.get('deliveryPeriodMax') or period_min)
+
+        return Estimate(price, price, period_min, period_max, 1, True)
+
+    def save(self, path):
+        """ Сохранить таблицу в файл, файл заменяется атомарно """
+        with self._lock:
+            data = marshal.dumps((self.FORMAT_VERSION, self.weight_brackets, self._table))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.pycdek-estimates-')
+        try:
+            os.fchmod(fd, get_file_mode())
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, path):
+        """ Загрузить таблицу из файла, сохраненного методом save """
+        with open(path, 'rb') as f:
+            version, weight_brackets, table = marshal.load(f)
+
+        if version != self.FORMAT_VERSION:
+            raise ValueError('Unsupported estimates format version %s' % version)
+        if tuple(weight_brackets) != tuple(self.weight_brackets):
+            raise ValueError('Estimates were built with different weight brackets')
+
+        with self._lock:
+            self._table = table
+
+        return self
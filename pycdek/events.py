@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import time
+import logging
+import sqlite3
+import datetime
+import threading
+from collections import namedtuple
+
+from records import parse_datetime
+from tracking import StatusTracker
+
+logger = logging.getLogger('pycdek')
+
+StatusEvent = namedtuple('StatusEvent', ['dispatch_number', 'state', 'order'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pycdek_status_feed (
+    dispatch_number TEXT PRIMARY KEY,
+    cursor TEXT,
+    status_code INTEGER,
+    interval REAL NOT NULL,
+    next_poll REAL
+);
+CREATE INDEX IF NOT EXISTS pycdek_status_feed_next_poll ON pycdek_status_feed (next_poll);
+'''
+
+
+def make_cursor(value):
+    """
+    Ключ даты статуса, сравнимый как строка: дата и время UTC в формате ISO 8601
+    :param value: дата из ответа СДЭК, строка, date или datetime
+    """
+    if isinstance(value, basestring):
+        value = parse_datetime(value)
+
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    elif value.utcoffset() is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+
+    return value.isoformat()
+
+
+class StatusFeed(object):
+    """
+    Лента изменений статусов заказов поверх опроса status_report_h.php.
+    Для каждого заказа в SQLite хранится курсор - дата последнего полученного статуса,
+    подписчики получают только статусы новее курсора.
+    Заказы, статус которых меняется, опрашиваются с интервалом min_interval,
+    при отсутствии изменений интервал удваивается до max_interval,
+    заказы в конечном статусе больше не опрашиваются.
+    Курсор заказа сдвигается только после передачи его статусов всем подписчикам (доставка не менее одного раза).
+    """
+    final_statuses = {2, 4, 5}
+    clock = staticmethod(time.time)
+
+    def __init__(self, client, path=':memory:', min_interval=300, max_interval=86400,
+                 batch_size=100, concurrency=4, clock=None):
+        """
+        :param client: экземпляр Client
+        :param path: путь к файлу базы SQLite с курсорами
+        :param min_interval: интервал опроса заказов в пути, секунд
+        :param max_interval: максимальный интервал опроса заказов без изменений, секунд
+        :param batch_size: количество заказов в одном запросе StatusReport
+        :param concurrency: количество одновременно выполняемых запросов
+        :param clock: функция, возвращающая текущее время в секундах, по умолчанию time.time
+        """
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tracker = StatusTracker(client, batch_size, concurrency)
+        if clock is not None:
+            self.clock = clock
+        self._consumers = []
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM pycdek_status_feed WHERE next_poll IS NOT NULL').fetchone()[0]
+
+    def close(self):
+        self.stop()
+        self._db.close()
+
+    def subscribe(self, consumer):
+        """
+        Подписаться на изменения статусов
+        :param consumer: функция, принимающая StatusEvent(dispatch_number, state, order),
+                         state - новый статус из истории (State), order - статус заказа из ответа.
+                         Если функция выбросила исключение, статусы заказа будут переданы повторно
+                         при следующем опросе, в том числе подписчикам, уже получившим их
+        :returns consumer
+        """
+        self._consumers.append(consumer)
+        return consumer
+
+    def unsubscribe(self, consumer):
+        self._consumers.remove(consumer)
+
+    def track(self, orders_dispatch_numbers):
+        """
+        Начать отслеживание заказов, при первом опросе подписчики получат всю историю статусов
+        Уже отслеживаемые заказы не изменяются
+        :param orders_dispatch_numbers: номера отправлений СДЭК
+        """
+        now = self.clock()
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR IGNORE INTO pycdek_status_feed (dispatch_number, interval, next_poll) VALUES (?, ?, ?)',
+                [(str(number), self.min_interval, now) for number in orders_dispatch_numbers],
+            )
+
+    def untrack(self, orders_dispatch_numbers):
+        """
+        Прекратить отслеживание заказов и удалить их курсоры
+        :param orders_dispatch_numbers: номера отправлений СДЭК
+        """
+        with self._lock, self._db:
+            self._db.executemany('DELETE FROM pycdek_status_feed WHERE dispatch_number = ?',
+                                 [(str(number),) for number in orders_dispatch_numbers])
+
+    def get_cursor(self, dispatch_number):
+        """
+        Курсор заказа
+        :param dispatch_number: номер отправления СДЭК
+        :returns дата последнего полученного статуса (UTC, ISO 8601) или None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT cursor FROM pycdek_status_feed WHERE dispatch_number = ?',
+                                   (str(dispatch_number),)).fetchone()
+        return row[0] if row else None
+
+    def _fetch(self, orders_dispatch_numbers, show_history):
+        statuses, failed = self.tracker.fetch(orders_dispatch_numbers, show_history)
+        orders = {}
+        for order in statuses:
+            if order.get('DispatchNumber') is not None and order.get('Status') is not None:
+                orders[str(order.get('DispatchNumber'))] = order
+
+        return orders, set(failed)
+
+    def _deliver(self, event):
+        for consumer in self._consumers:
+            try:
+                consumer(event)
+            except Exception:
+                logger.exception('Status event consumer failed')
+                return False
+
+        return True
+
+    def poll(self):
+        """
+        Опросить заказы, время опроса которых наступило, и передать новые статусы подписчикам
+        Сначала запрашиваются только текущие статусы, история - только для изменившихся заказов.
+        Заказы из пачек, запрос которых завершился ошибкой сети, будут опрошены при следующем вызове.
+        Одновременные вызовы выполняются по очереди
+        :returns list of StatusEvent, переданных подписчикам, в хронологическом порядке для каждого заказа
+        """
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self):
+        now = self.clock()
+        with self._lock:
+            due = dict((number, (cursor, interval)) for number, cursor, interval in self._db.execute(
+                'SELECT dispatch_number, cursor, interval FROM pycdek_status_feed WHERE next_poll <= ? ORDER BY dispatch_number',
+                (now,),
+            ))
+        if not due:
+            return []
+
+        current, failed = self._fetch(sorted(due), False)
+        changed = []
+        for number, order in sorted(current.items()):
+            try:
+                if due[number][0] is None or make_cursor(order.get('Status').get('Date')) > due[number][0]:
+                    changed.append(number)
+            except (TypeError, ValueError):
+                # заказ остается в очереди и будет запрошен при следующем опросе
+                logger.exception('Invalid status date of order %s', number)
+                failed.add(number)
+        history, history_failed = self._fetch(changed, True)
+        failed.update(history_failed)
+
+        delivered = []
+        updates = []
+        for number, (cursor, interval) in sorted(due.items()):
+            if number in failed:
+                continue
+
+            order = history.get(number) or current.get(number)
+            events = []
+            if order is not None and number in history:
+                status = order.get('Status')
+                try:
+                    for state in status.get('State') or [status]:
+                        state_cursor = make_cursor(state.get('Date'))
+                        if cursor is None or state_cursor > cursor:
+                            events.append((state_cursor, StatusEvent(number, state, order)))
+                except (TypeError, ValueError):
+                    logger.exception('Invalid status date of order %s', number)
+                    continue
+
+            new_cursor = cursor
+            complete = True
+            for state_cursor, event in sorted(events, key=lambda item: item[0]):
+                if not self._deliver(event):
+                    complete = False
+                    break
+                delivered.append(event)
+                new_cursor = state_cursor
+
+            if not complete:
+                # курсор сдвигается только до переданных статусов, остальные будут переданы при следующем опросе
+                updates.append((new_cursor, None, self.min_interval, now + self.min_interval, number))
+                continue
+
+            if new_cursor != cursor:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+
+            status_code = order.get('Status').get('Code') if order is not None else None
+            if status_code is not None:
+                status_code = int(status_code)
+            next_poll = None if status_code in self.final_statuses else now + interval
+            updates.append((new_cursor, status_code, interval, next_poll, number))
+
+        # курсоры сохраняются после передачи статусов подписчикам
+        with self._lock, self._db:
+            self._db.executemany(
+                'UPDATE pycdek_status_feed SET cursor = ?, status_code = COALESCE(?, status_code), interval = ?, next_poll = ? '
+                'WHERE dispatch_number = ?',
+                updates,
+            )
+
+        return delivered
+
+    def _poll_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Status feed poll failed')
+
+    def start(self, interval=60):
+        """
+        Запустить фоновый опрос
+        :param interval: как часто проверять, не наступило ли время опроса заказов, секунд
+        """
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._poll_loop, args=(interval,), name='pycdek-status-feed')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Остановить фоновый опрос """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
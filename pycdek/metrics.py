@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+from timeit import default_timer
+
+
+def get_endpoint(url):
+    """ Имя метода API по адресу: new_orders.php, pvzlist.php и т.д. """
+    return url.split('?', 1)[0].rsplit('/', 1)[-1]
+
+
+class Metrics(object):
+    """
+    Интерфейс метрик запросов к API СДЭК
+    Этапы запроса: serialize, sign, network, parse, convert
+    serialize включает сборку тела запроса (заказы, номера отправлений) и документа XML.
+    Для потоковых методов (iter_delivery_points, iter_orders_statuses, print_orders) network заканчивается
+    на получении заголовков ответа, чтение и разбор тела, которые чередуются с обработкой результатов, не замеряются
+    По умолчанию ничего не записывает, при enabled = False клиент не замеряет время вовсе
+    """
+    enabled = False
+
+    def timing(self, endpoint, stage, seconds):
+        """ Длительность этапа запроса """
+
+    def size(self, endpoint, direction, size):
+        """ Размер запроса (direction='request') или ответа (direction='response') в байтах """
+
+    def error(self, endpoint, error):
+        """ Ошибка запроса """
+
+
+class Timer(object):
+    __slots__ = ('metrics', 'endpoint', 'stage', 'started_at')
+
+    def __init__(self, metrics, endpoint, stage):
+        self.metrics = metrics
+        self.endpoint = endpoint
+        self.stage = stage
+        self.started_at = None
+
+    def __enter__(self):
+        self.started_at = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.timing(self.endpoint, self.stage, default_timer() - self.started_at)
+
+
+class NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Histogram(object):
+    """ Гистограмма с фиксированными границами интервалов """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        """ Верхняя граница интервала, в который попадает перцентиль """
+        if not self.count:
+            return None
+
+        rank = self.count * percent / 100.0
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': zip(list(self.bounds) + [None], self.counts),
+        }
+
+
+class InMemoryMetrics(Metrics):
+    """ Метрики в памяти процесса для экспорта во внешнюю систему мониторинга """
+    enabled = True
+    timing_bounds = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    size_bounds = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timings = {}
+            self.sizes = {}
+            self.errors = {}
+
+    def timing(self, endpoint, stage, seconds):
+        with self._lock:
+            histogram = self.timings.get((endpoint, stage))
+            if histogram is None:
+                histogram = self.timings[(endpoint, stage)] = Histogram(self.timing_bounds)
+            histogram.add(seconds)
+
+    def size(self, endpoint, direction, size):
+        with self._lock:
+            histogram = self.sizes.get((endpoint, direction))
+            if histogram is None:
+                histogram = self.sizes[(endpoint, direction)] = Histogram(self.size_bounds)
+            histogram.add(size)
+
+    def error(self, endpoint, error):
+        key = (endpoint, type(error).__name__)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def snapshot(self):
+        """
+        Текущие значения метрик
+        :returns dict {'timings': {(метод, этап): {...}}, 'sizes': {(метод, направление): {...}}, 'errors': {(метод, ошибка): количество}}
+        """
+        with self._lock:
+            return {
+                'timings': dict((key, histogram.as_dict()) for key, histogram in self.timings.items()),
+                'sizes': dict((key, histogram.as_dict()) for key, histogram in self.sizes.items()),
+                'errors': dict(self.errors),
+            }
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import time
+import random
+import urllib2
+import threading
+
+
+class CircuitOpenError(urllib2.URLError):
+    """ Запрос не выполнен, так как шлюз СДЭК недавно перестал отвечать """
+
+
+class RequestPolicy(object):
+    """ Таймаут и повторы запросов к одному адресу API """
+
+    def __init__(self, timeout=None, retries=0, backoff=0.5, max_backoff=10, jitter=0.5):
+        """
+        :param timeout: таймаут установки соединения и каждого чтения ответа в секундах, по умолчанию таймаут транспорта
+        :param retries: количество повторов при ошибках сети и ответах 5xx
+        :param backoff: пауза перед первым повтором в секундах, удваивается с каждым повтором
+        :param max_backoff: максимальная пауза в секундах
+        :param jitter: доля случайного увеличения паузы
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def get_delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay + random.uniform(0, delay * self.jitter)
+
+
+class CircuitBreaker(object):
+    """
+    Прерыватель: после failure_threshold ошибок подряд запросы сразу завершаются CircuitOpenError
+    в течение reset_timeout секунд, затем пропускается один пробный запрос
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial or time.time() < self._opened_at + self.reset_timeout:
+                raise CircuitOpenError('CDEK gateway is unavailable')
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+            self._trial = False
+
+
+class RateLimiter(object):
+    """ Ограничение частоты запросов (token bucket), общее для всех потоков """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: количество запросов в секунду
+        :param capacity: максимальное количество запросов подряд без ожидания
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Дождаться разрешения на запрос """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+
+
+class ConcurrencyLimiter(object):
+    """ Ограничение количества одновременных запросов, общее для всех потоков """
+
+    def __init__(self, limit):
+        """
+        :param limit: максимальное количество одновременных запросов
+        """
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._semaphore.release()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import itertools
+from collections import OrderedDict
+from multiprocessing.pool import AsyncResult
+
+from client import Client
+from policy import ConcurrencyLimiter, RateLimiter
+from utils import parallel_map
+
+
+def _wait(result):
+    # AsyncClient возвращает AsyncResult
+    return result.get() if isinstance(result, AsyncResult) else result
+
+
+def route_by_account_attribute(order):
+    """ Маршрутизация по атрибуту cdek_account заказа """
+    return getattr(order, 'cdek_account')
+
+
+class ClientPool(object):
+    """
+    Клиенты для нескольких договоров СДЭК (пар логин/пароль) в одном процессе
+    Заказы распределяются по договорам функцией маршрутизации, у каждого договора свои
+    ограничения частоты и количества одновременных запросов.
+    Пул keep-alive соединений и кеш расчетов стоимости общие: соединения не привязаны к договору,
+    а запросы к калькулятору выполняются без авторизации.
+    С client_class=AsyncClient методы одного заказа возвращают AsyncResult,
+    create_orders и get_orders_statuses дожидаются результатов всех договоров.
+    """
+
+    def __init__(self, accounts, router=route_by_account_attribute, client_class=Client, transport=None,
+                 quote_cache=None, rate=None, concurrency=None, **client_kwargs):
+        """
+        :param accounts: словарь {имя договора: (логин, пароль)}
+        :param router: функция, возвращающая имя договора для заказа
+        :param client_class: класс клиента
+        :param transport: общий экземпляр Transport
+        :param quote_cache: общий экземпляр QuoteCache
+        :param rate: максимальное количество запросов в секунду для каждого договора
+        :param concurrency: максимальное количество одновременных запросов для каждого договора
+        :param client_kwargs: остальные параметры клиента
+        """
+        self.router = router
+        self.clients = OrderedDict()
+        for name, (login, password) in sorted(accounts.items()):
+            self.clients[name] = client_class(
+                login, password,
+                transport=transport,
+                quote_cache=quote_cache,
+                rate_limiter=RateLimiter(rate) if rate else None,
+                concurrency_limiter=ConcurrencyLimiter(concurrency) if concurrency else None,
+                **client_kwargs
+            )
+
+    def __getitem__(self, account):
+        return self.clients[account]
+
+    def route(self, order):
+        """ Имя договора для заказа """
+        if len(self.clients) == 1:
+            return next(iter(self.clients))
+
+        return self.router(order)
+
+    def get_client(self, order):
+        """ Клиент договора, к которому относится заказ """
+        return self.clients[self.route(order)]
+
+    def get_shipping_cost(self, sender_city_id, receiver_city_id, tariffs, goods):
+        return next(iter(self.clients.values())).get_shipping_cost(sender_city_id, receiver_city_id, tariffs, goods)
+
+    def create_order(self, order):
+        return self.get_client(order).create_order(order)
+
+    def delete_order(self, order):
+        return self.get_client(order).delete_order(order)
+
+    def create_orders(self, orders, batch_size=100, concurrency=4):
+        """
+        Создать заказы, распределив их по договорам, договоры обрабатываются параллельно
+        :param concurrency: количество одновременно выполняемых запросов для каждого договора
+        :returns list of CreateOrderResult в порядке исходных заказов
+        """
+        orders = list(orders)
+        indexes_by_account = OrderedDict()
+        for i, order in enumerate(orders):
+            indexes_by_account.setdefault(self.route(order), []).append(i)
+
+        def create(item):
+            account, indexes = item
+            return _wait(self.clients[account].create_orders([orders[i] for i in indexes], batch_size, concurrency))
+
+        results = [None] * len(orders)
+        account_results = parallel_map(create, indexes_by_account.items(), len(indexes_by_account))
+        for (_, indexes), batch_results in itertools.izip(indexes_by_account.items(), account_results):
+            for i, result in itertools.izip(indexes, batch_results):
+                results[i] = result
+
+        return results
+
+    def get_orders_statuses(self, orders_dispatch_numbers, show_history=True):
+        """
+        Статусы заказов по всем договорам, договоры опрашиваются параллельно
+        :param orders_dispatch_numbers: словарь {имя договора: список номеров отправлений СДЭК}
+        :returns dict {имя договора: список статусов}
+        """
+        def get_statuses(item):
+            account, numbers = item
+            return _wait(self.clients[account].get_orders_statuses(numbers, show_history))
+
+        items = orders_dispatch_numbers.items()
+        return dict(itertools.izip((account for account, _ in items), parallel_map(get_statuses, items, len(items))))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from decimal import Decimal, InvalidOperation
+from collections import OrderedDict, namedtuple
+
+from client import Client
+from transport import NETWORK_ERRORS
+from utils import parallel_map
+
+Route = namedtuple('Route', ['sender_city_id', 'receiver_city_id', 'goods'])
+Quote = namedtuple('Quote', ['route_index', 'route', 'tariff', 'price', 'period_min', 'period_max', 'error'])
+
+
+def cheapest(quote):
+    """ Стратегия выбора: минимальная стоимость, при равной стоимости - минимальный срок """
+    return quote.price, quote.period_max
+
+
+def fastest(quote):
+    """ Стратегия выбора: минимальный срок, при равном сроке - минимальная стоимость """
+    return quote.period_max, quote.price
+
+
+def cheapest_within(days):
+    """ Стратегия выбора: минимальная стоимость среди тарифов со сроком доставки не больше days дней """
+    def strategy(quote):
+        return quote.period_max > days, quote.price, quote.period_max
+
+    return strategy
+
+
+class QuoteEngine(object):
+    """
+    Параллельный расчет стоимости доставки для набора маршрутов и тарифов
+    Каждая пара (маршрут, тариф) рассчитывается отдельным запросом к калькулятору,
+    поэтому результат содержит стоимость и сроки по каждому тарифу, а не только по первому доступному.
+    Если у клиента включен кеш расчетов, он используется для каждого запроса.
+    """
+
+    def __init__(self, client=Client, concurrency=8, strategy=cheapest):
+        """
+        :param client: класс или экземпляр Client
+        :param concurrency: количество одновременно выполняемых запросов
+        :param strategy: функция, возвращающая ключ сортировки для Quote, по умолчанию cheapest
+        """
+        self.client = client
+        self.concurrency = concurrency
+        self.strategy = strategy
+
+    def _quote(self, task):
+        route_index, route, tariff = task
+        try:
+            response = self.client.get_shipping_cost(route.sender_city_id, route.receiver_city_id, [tariff], route.goods)
+        except NETWORK_ERRORS + (ValueError,) as e:
+            # ValueError - ответ калькулятора не JSON
+            return Quote(route_index, route, tariff, None, None, None, e)
+
+        result = response.get('result')
+        if not result:
+            return Quote(route_index, route, tariff, None, None, None, response.get('error') or response)
+
+        try:
+            price = Decimal(str(result['price']))
+            # калькулятор может вернуть сроки строками, стратегии сравнивают их как числа
+            period_min, period_max = [int(result[name]) if result.get(name) not in (None, '') else None
+                                      for name in ('deliveryPeriodMin', 'deliveryPeriodMax')]
+        except (KeyError, InvalidOperation, TypeError, ValueError):
+            return Quote(route_index, route, tariff, None, None, None, response)
+
+        return Quote(route_index, route, tariff, price, period_min, period_max, None)
+
+    def compare(self, routes, tariffs):
+        """
+        Рассчитать стоимость доставки по всем маршрутам и тарифам
+        :param routes: список (ID города отправителя, ID города получателя, список товаров)
+        :param tariffs: список тарифов
+        :returns list of Quote по маршрутам и тарифам в исходном порядке,
+                 для недоступных тарифов price равен None, а error содержит ошибку калькулятора или сети
+        """
+        routes = [Route(*route) for route in routes]
+        tasks = [(route_index, route, tariff) for route_index, route in enumerate(routes) for tariff in tariffs]
+
+        return parallel_map(self._quote, tasks, self.concurrency)
+
+    def best(self, quotes, strategy=None):
+        """
+        Лучший вариант доставки среди доступных
+        :param quotes: результат compare
+        :param strategy: стратегия выбора, по умолчанию стратегия движка
+        :returns Quote или None, если доступных вариантов нет
+        """
+        available = [quote for quote in quotes if quote.error is None]
+        if not available:
+            return None
+
+        return min(available, key=strategy or self.strategy)
+
+    def best_by_route(self, quotes, strategy=None):
+        """
+        Лучший вариант доставки для каждого маршрута
+        :returns list of Quote или None в порядке маршрутов
+        """
+        return [self.best(route_quotes.values(), strategy) for route_quotes in self.as_matrix(quotes).values()]
+
+    def as_matrix(self, quotes):
+        """
+        Таблица вариантов доставки
+        :returns OrderedDict {индекс маршрута: OrderedDict {тариф: Quote}}
+        """
+        matrix = OrderedDict()
+        for quote in quotes:
+            matrix.setdefault(quote.route_index, OrderedDict())[quote.tariff] = quote
+
+        return matrix
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import re
+import datetime
+from decimal import Decimal
+
+DATETIME_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6})\d*)?)?)?'
+    r'(Z|[+-]\d{2}:?\d{2})?$'
+)
+
+
+class FixedOffset(datetime.tzinfo):
+    """ Часовой пояс с фиксированным смещением от UTC """
+
+    def __init__(self, minutes):
+        self._offset = datetime.timedelta(minutes=minutes)
+        self._name = '%s%02d:%02d' % ('-' if minutes < 0 else '+', abs(minutes) // 60, abs(minutes) % 60)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return self._name
+
+    def __repr__(self):
+        return 'FixedOffset(%s)' % self._name
+
+
+def parse_datetime(value):
+    """
+    Разбор даты в формате ISO 8601, используемом в ответах СДЭК
+    :returns date, если время не указано, иначе datetime
+    """
+    match = DATETIME_RE.match(value)
+    if match is None:
+        raise ValueError('Invalid date "%s"' % value)
+
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    if hour is None:
+        return datetime.date(int(year), int(month), int(day))
+
+    tzinfo = None
+    if offset == 'Z':
+        tzinfo = FixedOffset(0)
+    elif offset:
+        minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+        tzinfo = FixedOffset(-minutes if offset[0] == '-' else minutes)
+
+    return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0),
+                             int((fraction or '0').ljust(6, '0')), tzinfo)
+
+
+def element_to_dict(element):
+    """ Атрибуты и дочерние элементы XML в виде словаря, дочерние элементы - списки по тегу """
+    data = dict(element.attrib)
+    for child in element:
+        data.setdefault(child.tag, []).append(element_to_dict(child))
+
+    return data
+
+
+class Record(object):
+    """
+    Компактная запись ответа СДЭК, значения атрибутов приводятся к типам один раз при разборе
+    fields - (имя поля, атрибут XML, функция приведения типа)
+    children - (имя поля, путь к дочерним элементам, класс записи, список или один элемент)
+    Доступ по имени атрибута XML (record['Code']) совместим со словарями из Client._xml_to_dict
+    Атрибуты и дочерние элементы, которых нет в fields и children, а также исходные значения,
+    которые не удалось привести к типу (поле при этом None), сохраняются в extra (см. element_to_dict)
+    """
+    __slots__ = ('extra',)
+    fields = ()
+    children = ()
+    _known = {}
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+        self.extra = kwargs.get('extra')
+
+    @classmethod
+    def _get_known(cls):
+        known = Record._known.get(cls)
+        if known is None:
+            known = Record._known[cls] = (
+                frozenset(xml_name for _, xml_name, _ in cls.fields),
+                frozenset(path.split('/', 1)[0] for _, path, _, _ in cls.children),
+            )
+
+        return known
+
+    @classmethod
+    def from_xml(cls, element):
+        record = cls.__new__(cls)
+        attrib = element.attrib
+        extra = None
+
+        for name, xml_name, converter in cls.fields:
+            value = attrib.get(xml_name) or None
+            if value is not None and converter is not None:
+                try:
+                    value = converter(value)
+                except (ValueError, ArithmeticError):
+                    extra = extra or {}
+                    extra[xml_name] = value
+                    value = None
+            setattr(record, name, value)
+
+        for name, path, record_class, many in cls.children:
+            if many:
+                setattr(record, name, [record_class.from_xml(child) for child in element.iterfind(path)])
+            else:
+                child = element.find(path)
+                setattr(record, name, record_class.from_xml(child) if child is not None else None)
+
+        known_attrib, known_children = cls._get_known()
+        if not known_attrib.issuperset(attrib):
+            for key, value in attrib.items():
+                if key not in known_attrib:
+                    extra = extra or {}
+                    extra[key] = value
+
+        for child in element:
+            if child.tag not in known_children:
+                extra = extra or {}
+                extra.setdefault(child.tag, []).append(element_to_dict(child))
+
+        record.extra = extra
+        return record
+
+    def get(self, key, default=None):
+        for name, xml_name, _ in self.fields:
+            if xml_name == key:
+                value = getattr(self, name)
+                return default if value is None else value
+
+        for name, path, _, _ in self.children:
+            if path.rsplit('/', 1)[-1] == key:
+                return getattr(self, name)
+
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+
+        return value
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.extra == other.extra and \
+            all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        values = ['%s=%r' % (name, getattr(self, name)) for name in self.__slots__]
+        if self.extra:
+            values.append('extra=%r' % self.extra)
+
+        return '%s(%s)' % (type(self).__name__, ', '.join(values))
+
+
+class Pvz(Record):
+    """ Пункт самовывоза """
+    fields = (
+        ('code', 'Code', None),
+        ('name', 'Name', None),
+        ('type', 'Type', None),
+        ('city_code', 'CityCode', int),
+        ('city', 'City', None),
+        ('postal_code', 'PostalCode', None),
+        ('address', 'Address', None),
+        ('work_time', 'WorkTime', None),
+        ('phone', 'Phone', None),
+        ('email', 'Email', None),
+        ('note', 'Note', None),
+        ('coord_x', 'coordX', float),
+        ('coord_y', 'coordY', float),
+    )
+    __slots__ = tuple(field[0] for field in fields)
+
+
+class State(Record):
+    """ Статус заказа из истории """
+    fields = (
+        ('date', 'Date', parse_datetime),
+        ('code', 'Code', int),
+        ('description', 'Description', None),
+        ('city_code', 'CityCode', int),
+        ('city_name', 'CityName', None),
+    )
+    __slots__ = tuple(field[0] for field in fields)
+
+
+class Status(Record):
+    """ Текущий статус заказа с историей """
+    fields = State.fields
+    children = (
+        ('states', 'State', State, True),
+    )
+    __slots__ = tuple(field[0] for field in fields) + ('states',)
+
+
+class Delay(Record):
+    """ Перенос доставки по договоренности с получателем """
+    fields = (
+        ('date', 'Date', parse_datetime),
+        ('date_next', 'DateNext', parse_datetime),
+    )
+    __slots__ = tuple(field[0] for field in fields)
+
+
+class Item(Record):
+    """ Товар в упаковке """
+    fields = (
+        ('ware_key', 'WareKey', None),
+        ('amount', 'Amount', int),
+        ('deliv_amount', 'DelivAmount', int),
+        ('weight', 'Weight', Decimal),
+        ('cost', 'Cost', Decimal),
+        ('payment', 'Payment', Decimal),
+    )
+    __slots__ = tuple(field[0] for field in fields)
+
+
+class Package(Record):
+    """ Упаковка заказа """
+    fields = (
+        ('number', 'Number', None),
+        ('bar_code', 'BarCode', None),
+        ('weight', 'Weight', Decimal),
+    )
+    children = (
+        ('items', 'Item', Item, True),
+    )
+    __slots__ = tuple(field[0] for field in fields) + ('items',)
+
+
+class OrderStatus(Record):
+    """ Статус заказа из отчета status_report_h.php """
+    fields = (
+        ('act_number', 'ActNumber', None),
+        ('number', 'Number', None),
+        ('dispatch_number', 'DispatchNumber', None),
+        ('delivery_date', 'DeliveryDate', parse_datetime),
+        ('recipient_name', 'RecipientName', None),
+    )
+    children = (
+        ('status', 'Status', Status, False),
+        ('packages', 'Package', Package, True),
+        ('delays', 'Call/CallDelay/Delay', Delay, True),
+    )
+    __slots__ = tuple(field[0] for field in fields) + ('status', 'packages', 'delays')
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import datetime
+
+
+def now():
+    return datetime.datetime.now().isoformat()
+
+
+class Signer(object):
+    """
+    Подпись запросов к интеграционному API: атрибуты Date, Account и Secure
+    Последняя подпись кешируется, запросы с той же датой не пересчитывают md5.
+    Может использоваться из нескольких потоков одновременно
+    """
+    clock = staticmethod(now)
+
+    def __init__(self, login, password, clock=None):
+        """
+        :param login: логин
+        :param password: пароль
+        :param clock: функция без аргументов, возвращающая дату запроса строкой,
+                      по умолчанию текущее время в формате ISO 8601
+        """
+        self.login = login
+        self._suffix = '&%s' % password
+        if clock is not None:
+            self.clock = clock
+        # (дата, подпись) заменяется целиком, поэтому читается без блокировки
+        self._last = (None, None)
+
+    def get_secure(self, date):
+        """
+        Подпись для даты запроса
+        :param date: дата запроса строкой
+        """
+        last_date, secure = self._last
+        if date != last_date:
+            secure = hashlib.md5(date + self._suffix).hexdigest()
+            self._last = (date, secure)
+
+        return secure
+
+    def sign(self, attrib, date=None):
+        """
+        Добавить атрибуты подписи в атрибуты корневого элемента запроса
+        :param attrib: словарь атрибутов
+        :param date: дата запроса, по умолчанию из clock
+        :returns attrib
+        """
+        if date is None:
+            date = self.clock()
+
+        attrib['Date'] = date
+        attrib['Account'] = self.login
+        attrib['Secure'] = self.get_secure(date)
+        return attrib
+
+    def sign_many(self, attribs):
+        """
+        Подписать атрибуты нескольких запросов одной датой и подписью
+        :param attribs: список словарей атрибутов
+        :returns attribs
+        """
+        date = self.clock()
+        signature = {'Date': date, 'Account': self.login, 'Secure': self.get_secure(date)}
+        for attrib in attribs:
+            attrib.update(signature)
+
+        return attribs
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import mmap
+import struct
+import tempfile
+
+from records import Record
+from utils import get_file_mode
+
+MAGIC = 'PYCDEKPVZ1'
+HEADER = struct.Struct('<10sIIIII')
+RECORD = struct.Struct('<II')
+STRING_KEY = struct.Struct('<III')
+INT_KEY = struct.Struct('<II')
+
+
+def _to_dict(point):
+    if isinstance(point, Record):
+        data = dict(point.extra or {})
+        data.update((xml_name, getattr(point, name)) for name, xml_name, _ in point.fields if getattr(point, name) is not None)
+        return data
+
+    return point
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    return str(value)
+
+
+def write_snapshot(points, path):
+    """
+    Сохранить список пунктов самовывоза в бинарный файл для DeliveryPointSnapshot
+    Файл заменяется атомарно, работающие процессы продолжают читать старую версию
+    :param points: пункты самовывоза, словари или записи Pvz
+    :param path: путь к файлу
+    """
+    records = []
+    codes = []
+    cities = []
+    postcodes = []
+
+    for i, point in enumerate(points):
+        point = _to_dict(point)
+        records.append(_encode(json.dumps(point, separators=(',', ':'), ensure_ascii=False)))
+        codes.append((_encode(point['Code']), i))
+        if point.get('PostalCode'):
+            postcodes.append((_encode(point['PostalCode']), i))
+        try:
+            cities.append((int(point['CityCode']), i))
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    codes.sort()
+    postcodes.sort()
+    cities.sort()
+
+    data = []
+    offset = HEADER.size
+
+    def append(chunk):
+        data.append(chunk)
+        return offset + len(chunk)
+
+    record_offsets = []
+    for record in records:
+        record_offsets.append((offset, len(record)))
+        offset = append(record)
+
+    key_offsets = {}
+    for key, _ in codes + postcodes:
+        if key not in key_offsets:
+            key_offsets[key] = offset
+            offset = append(key)
+
+    records_table = offset
+    offset = append(''.join(RECORD.pack(*item) for item in record_offsets))
+    codes_table = offset
+    offset = append(''.join(STRING_KEY.pack(key_offsets[key], len(key), i) for key, i in codes))
+    postcodes_table = offset
+    offset = append(''.join(STRING_KEY.pack(key_offsets[key], len(key), i) for key, i in postcodes))
+    cities_table = offset
+    append(''.join(INT_KEY.pack(city, i) for city, i in cities))
+
+    header = HEADER.pack(MAGIC, len(records), records_table, codes_table, postcodes_table, cities_table)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.pvz-snapshot-')
+    try:
+        # файл читают и воркеры других пользователей
+        os.fchmod(fd, get_file_mode())
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.writelines(data)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class DeliveryPointSnapshot(object):
+    """
+    Пункты самовывоза из файла write_snapshot, отображенного в память только для чтения
+    Страницы файла разделяются всеми процессами через page cache, записи декодируются только при обращении к ним
+    """
+
+    def __init__(self, path):
+        """
+        :param path: путь к файлу снимка
+        """
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count, self._records, self._codes, self._postcodes, self._cities = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError('"%s" is not a delivery points snapshot' % path)
+
+        self._codes_count = (self._postcodes - self._codes) // STRING_KEY.size
+        self._postcodes_count = (self._cities - self._postcodes) // STRING_KEY.size
+        self._cities_count = (len(self._mmap) - self._cities) // INT_KEY.size
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in xrange(self._count):
+            yield self._get_record(i)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_record(self, index):
+        offset, length = RECORD.unpack_from(self._mmap, self._records + index * RECORD.size)
+        return json.loads(self._mmap[offset:offset + length])
+
+    def _get_string_key(self, table, index):
+        offset, length, record = STRING_KEY.unpack_from(self._mmap, table + index * STRING_KEY.size)
+        return self._mmap[offset:offset + length], record
+
+    def _find_string(self, table, count, key):
+        key = _encode(key)
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_string_key(table, middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        records = []
+        while low < count:
+            found, record = self._get_string_key(table, low)
+            if found != key:
+                break
+            records.append(record)
+            low += 1
+
+        return records
+
+    def _find_int(self, table, count, key):
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if INT_KEY.unpack_from(self._mmap, table + middle * INT_KEY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        records = []
+        while low < count:
+            found, record = INT_KEY.unpack_from(self._mmap, table + low * INT_KEY.size)
+            if found != key:
+                break
+            records.append(record)
+            low += 1
+
+        return records
+
+    def get(self, code):
+        """
+        Пункт самовывоза по коду
+        :param code: код пункта
+        :returns dict или None
+        """
+        records = self._find_string(self._codes, self._codes_count, code)
+        return self._get_record(records[0]) if records else None
+
+    def get_city_points(self, city_id):
+        """
+        Пункты самовывоза в городе
+        :param city_id: ID города по базе СДЭК
+        :returns list
+        """
+        return [self._get_record(i) for i in self._find_int(self._cities, self._cities_count, int(city_id))]
+
+    def get_postcode_points(self, postcode):
+        """
+        Пункты самовывоза по почтовому индексу
+        :param postcode: почтовый индекс
+        :returns list
+        """
+        return [self._get_record(i) for i in self._find_string(self._postcodes, self._postcodes_count, postcode)]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from transport import NETWORK_ERRORS
+from utils import chunks, parallel_map
+
+logger = logging.getLogger('pycdek')
+
+
+class StatusTracker(object):
+    """
+    Отслеживание статусов большого количества заказов.
+    Номера отправлений дедуплицируются и запрашиваются параллельными пачками,
+    последний известный статус каждого заказа хранится в памяти, poll возвращает только изменения.
+    """
+
+    def __init__(self, client, batch_size=100, concurrency=4, show_history=False):
+        """
+        :param client: экземпляр Client
+        :param batch_size: количество заказов в одном запросе StatusReport
+        :param concurrency: количество одновременно выполняемых запросов
+        :param show_history: получать историю статусов (увеличивает объем ответов)
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.show_history = show_history
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def _fetch(self, task):
+        orders_dispatch_numbers, show_history = task
+        try:
+            return self.client.get_orders_statuses(orders_dispatch_numbers, show_history)
+        except NETWORK_ERRORS:
+            logger.exception('Orders statuses request failed')
+            return None
+
+    def fetch(self, orders_dispatch_numbers, show_history=None):
+        """
+        Запросить статусы заказов параллельными пачками
+        :param orders_dispatch_numbers: номера отправлений СДЭК
+        :param show_history: получать историю статусов, по умолчанию self.show_history
+        :returns (список статусов заказов, номера отправлений из пачек, запрос которых завершился ошибкой сети)
+        """
+        if show_history is None:
+            show_history = self.show_history
+
+        batches = chunks(orders_dispatch_numbers, self.batch_size)
+        tasks = [(batch, show_history) for batch in batches]
+        statuses = []
+        failed = []
+        for batch, batch_statuses in zip(batches, parallel_map(self._fetch, tasks, self.concurrency)):
+            if batch_statuses is None:
+                failed.extend(batch)
+            else:
+                statuses.extend(batch_statuses)
+
+        return statuses, failed
+
+    def poll(self, orders_dispatch_numbers):
+        """
+        Запросить статусы заказов
+        Пачки, запрос которых завершился ошибкой сети, пропускаются и будут запрошены при следующем вызове
+        :param orders_dispatch_numbers: номера отправлений СДЭК
+        :returns list заказов, статус которых изменился с прошлого вызова
+        """
+        numbers = sorted(set(str(number) for number in orders_dispatch_numbers))
+        changes = []
+
+        for order in self.fetch(numbers)[0]:
+            dispatch_number = order.get('DispatchNumber')
+            status = order.get('Status')
+            if dispatch_number is None or status is None:
+                continue
+
+            state = (status.get('Code'), status.get('Date'))
+            with self._lock:
+                if self._states.get(dispatch_number) == state:
+                    continue
+                self._states[dispatch_number] = state
+            changes.append(order)
+
+        return changes
+
+    def get_state(self, dispatch_number):
+        """
+        Последний известный статус заказа
+        :param dispatch_number: номер отправления СДЭК
+        :returns (код статуса, дата) или None
+        """
+        return self._states.get(str(dispatch_number))
+
+    def forget(self, orders_dispatch_numbers):
+        """
+        Прекратить отслеживание заказов
+        :param orders_dispatch_numbers: номера отправлений СДЭК
+        """
+        with self._lock:
+            for dispatch_number in orders_dispatch_numbers:
+                self._states.pop(str(dispatch_number), None)
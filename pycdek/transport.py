@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import os
+import Queue
+import select
+import socket
+import httplib
+import urllib2
+import urlparse
+import StringIO
+import threading
+
+NETWORK_ERRORS = (urllib2.URLError, httplib.HTTPException, socket.error)
+
+
+class Transport(object):
+    """ Базовый класс транспорта HTTP запросов к API СДЭК """
+
+    def open(self, url, data=None, method='GET', timeout=None):
+        """
+        Выполнить запрос и вернуть объект ответа с методами read() и close()
+        :param url: адрес запроса
+        :param data: тело POST запроса
+        :param method: HTTP метод
+        :param timeout: таймаут в секундах
+        """
+        raise NotImplementedError
+
+    def request(self, url, data=None, method='GET', timeout=None):
+        """
+        Выполнить запрос и вернуть тело ответа
+        """
+        response = self.open(url, data, method, timeout)
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+
+class UrllibTransport(Transport):
+    """ Транспорт на urllib2, новое соединение на каждый запрос """
+
+    def __init__(self, timeout=30):
+        """
+        :param timeout: таймаут в секундах, если он не задан для запроса
+        """
+        self.timeout = timeout
+
+    def open(self, url, data=None, method='GET', timeout=None):
+        if method not in ('GET', 'POST'):
+            raise NotImplementedError('Unknown method "%s"' % method)
+
+        request = urllib2.Request(url, data=data if method == 'POST' else None)
+        timeout = timeout or self.timeout
+        if timeout is None:
+            return urllib2.urlopen(request)
+
+        return urllib2.urlopen(request, timeout=timeout)
+
+
+class PooledResponse(object):
+    """ Ответ, возвращающий соединение в пул после полного чтения """
+
+    def __init__(self, transport, key, connection, response):
+        self._transport = transport
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+
+    def read(self, amt=None):
+        data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+
+        return data
+
+    def close(self):
+        if self._connection is None:
+            return
+
+        if self._response.isclosed():
+            self._release()
+        else:
+            # недочитанный ответ оставляет соединение в неопределенном состоянии
+            self._connection.close()
+            self._connection = None
+
+    def _release(self):
+        if self._connection is not None:
+            self._transport._release(self._key, self._connection, self._response.will_close)
+            self._connection = None
+
+
+class PooledTransport(Transport):
+    """
+    Транспорт с пулом keep-alive соединений для каждого хоста.
+    Потокобезопасен, один экземпляр можно использовать из нескольких потоков.
+    После fork() дочерний процесс не использует соединения родителя и открывает свои.
+    Перенаправления и прокси (http_proxy) не поддерживаются, для них используйте UrllibTransport.
+    """
+    connection_classes = {
+        'http': httplib.HTTPConnection,
+        'https': httplib.HTTPSConnection,
+    }
+
+    def __init__(self, pool_size=10, connect_timeout=None, read_timeout=30):
+        """
+        :param pool_size: максимальное количество простаивающих соединений к одному хосту
+        :param connect_timeout: таймаут установки соединения в секундах, по умолчанию таймаут запроса
+        :param read_timeout: таймаут чтения ответа в секундах, если таймаут не задан для запроса
+        """
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._pools = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _get_pool(self, key):
+        with self._lock:
+            if self._pid != os.getpid():
+                # соединения, унаследованные от родительского процесса, используются им же
+                self._pools = {}
+                self._pid = os.getpid()
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = Queue.LifoQueue(self.pool_size)
+
+        return pool
+
+    @staticmethod
+    def _is_stale(connection):
+        # простаивающее соединение не должно быть доступно для чтения,
+        # иначе сервер его закрыл или прислал лишние данные
+        try:
+            return bool(select.select([connection.sock], [], [], 0)[0])
+        except (select.error, socket.error, ValueError):
+            return True
+
+    def _acquire(self, key, timeout=None):
+        pool = self._get_pool(key)
+        while True:
+            try:
+                connection = pool.get_nowait()
+            except Queue.Empty:
+                break
+
+            if not self._is_stale(connection):
+                return connection, True
+            connection.close()
+
+        scheme, host, port = key
+        connection = self.connection_classes[scheme](host, port, timeout=self.connect_timeout or timeout)
+        connection.connect()
+        connection.pid = os.getpid()
+
+        return connection, False
+
+    def _release(self, key, connection, will_close=False):
+        if will_close:
+            connection.close()
+            return
+
+        if connection.pid != os.getpid():
+            # соединение открыто до fork()
+            connection.close()
+            return
+
+        try:
+            self._get_pool(key).put_nowait(connection)
+        except Queue.Full:
+            connection.close()
+
+    def close(self):
+        """ Закрыть все простаивающие соединения """
+        with self._lock:
+            pools, self._pools = self._pools, {}
+
+        for pool in pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except Queue.Empty:
+                    break
+
+    def open(self, url, data=None, method='GET', timeout=None):
+        if method not in ('GET', 'POST'):
+            raise NotImplementedError('Unknown method "%s"' % method)
+
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in self.connection_classes:
+            raise NotImplementedError('Unknown scheme "%s"' % parts.scheme)
+
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        headers = {'Connection': 'keep-alive'}
+        if method == 'POST':
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        else:
+            data = None
+
+        while True:
+            connection, reused = self._acquire(key, timeout or self.read_timeout)
+            sent = False
+            try:
+                connection.sock.settimeout(timeout or self.read_timeout)
+                connection.request(method, path, data, headers)
+                sent = True
+                response = connection.getresponse()
+            except (socket.error, httplib.HTTPException) as e:
+                connection.close()
+                # сервер мог закрыть простаивающее соединение, запрос повторяется на новом,
+                # только если сервер не мог его обработать: запрос не отправлен целиком
+                # либо это GET; после таймаута запрос не повторяется
+                if reused and not isinstance(e, socket.timeout) and (not sent or method == 'GET'):
+                    continue
+                raise
+            break
+
+        if response.status >= 400:
+            body = response.read()
+            self._release(key, connection, response.will_close)
+            raise urllib2.HTTPError(url, response.status, response.reason, response.msg, StringIO.StringIO(body))
+
+        return PooledResponse(self, key, connection, response)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import os
+import types
+from multiprocessing.pool import ThreadPool
+
+
+class hybridmethod(object):
+    """
+    Метод, который при вызове от класса получает класс, а при вызове от экземпляра - экземпляр.
+    Позволяет вызывать методы, не требующие логина и пароля, как от Client, так и от настроенного клиента.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        return types.MethodType(self.func, owner if instance is None else instance)
+
+
+def chunks(items, size):
+    """ Разбить список на части размером не больше size """
+    items = list(items)
+    return [items[i:i + size] for i in xrange(0, len(items), size)]
+
+
+def parallel_map(func, items, concurrency):
+    """
+    Применить func к каждому элементу, выполняя не больше concurrency вызовов одновременно
+    Порядок результатов соответствует порядку элементов
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return map(func, items)
+
+    pool = ThreadPool(min(concurrency, len(items)))
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_file_mode():
+    """ Права нового файла с учетом umask процесса, mkstemp создает файлы с правами 0600 """
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0666 & ~umask
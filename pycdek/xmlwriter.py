@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from xml.etree.ElementTree import _escape_attrib
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" ?>'
+ENCODING = 'UTF-8'
+
+
+def escape(value):
+    """ Экранирование значения атрибута, как в ElementTree """
+    return _escape_attrib(value, ENCODING)
+
+
+def format_attrib(attrib):
+    """ Атрибуты элемента в порядке, в котором их записывает ElementTree """
+    return ''.join(' %s="%s"' % (name, escape(attrib[name])) for name in sorted(attrib))
+
+
+class ElementTemplate(object):
+    """
+    Пустой элемент с фиксированным набором атрибутов
+    Сортировка атрибутов и разметка вычисляются один раз, при записи подставляются только значения
+    """
+
+    def __init__(self, tag, *names):
+        self.names = tuple(sorted(names))
+        self.pattern = '<%s%s />' % (tag, ''.join(' %s="%%s"' % name for name in self.names))
+
+    def render(self, **values):
+        return self.pattern % tuple(escape(values[name]) for name in self.names)
+
+
+class XmlWriter(object):
+    """
+    Последовательная запись XML запроса в буфер без построения дерева элементов
+    Результат побайтно совпадает с ElementTree.write(encoding='UTF-8')
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self.write = self._buffer.append
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def start(self, tag, attrib):
+        self.write('<%s%s>' % (tag, format_attrib(attrib)))
+
+    def end(self, tag):
+        self.write('</%s>' % tag)
+
+    def element(self, tag, attrib):
+        self.write('<%s%s />' % (tag, format_attrib(attrib)))
+
+    def getvalue(self):
+        return ''.join(self._buffer)
+
+    def reset(self):
+        del self._buffer[:]
+
+    def truncate(self, size):
+        """ Отменить записи, сделанные после того, как len(writer) был равен size """
+        del self._buffer[size:]
+
+
+def make_document(tag, attrib, body=''):
+    """
+    Документ запроса с корневым элементом tag
+    :param body: уже записанные дочерние элементы
+    """
+    if body:
+        return '%s<%s%s>%s</%s>' % (XML_DECLARATION, tag, format_attrib(attrib), body, tag)
+
+    return '%s<%s%s />' % (XML_DECLARATION, tag, format_attrib(attrib))
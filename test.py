@@ -1,6 +1,29 @@
 # -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import shutil
+import hashlib
+import socket
+import datetime
+import tempfile
 import unittest
-from pycdek import Client
+import urlparse
+import StringIO
+import urllib2
+import threading
+import BaseHTTPServer
+from xml.etree import ElementTree
+from pycdek import AbstractOrder, OrderLineData, Pvz, AsyncClient, Client, ClientPool, PooledTransport, Transport, MemoryQuoteCache, DeliveryPointCatalog, DeliveryPointSnapshot, OrderStatus, Signer, StatusFeed, StatusTracker
+from pycdek import TariffEstimator, QuoteEngine, cheapest, fastest, cheapest_within
+from pycdek import policy, CircuitBreaker, CircuitOpenError, RateLimiter, RequestPolicy
+from pycdek.cache import make_quote_key
+from pycdek.metrics import Histogram, InMemoryMetrics, Timer
+from pycdek.xmlwriter import ElementTemplate, XmlWriter, make_document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+from run import make_client
+from server import load_payloads, make_server
 
 
 class TestCDEK(unittest.TestCase):
@@ -17,5 +40,1040 @@ class TestCDEK(unittest.TestCase):
         self.assertIsNone(response.get('error'))
 
 
+def start_server(handler_class):
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), handler_class)
+    server.requests = []
+    server.handle_error = lambda request, client_address: None
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%s/new_orders.php' % server.server_port
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0
+    close_after_response = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('Content-Length')))
+        self.server.requests.append(self.path)
+        if len(self.server.requests) > 1:
+            time.sleep(self.delay)
+
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+        self.wfile.flush()
+        if self.close_after_response:
+            # соединение закрывается без заголовка Connection: close
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = 1
+
+
+class TestPooledTransport(unittest.TestCase):
+    def test_post_not_resent_after_timeout(self):
+        class SlowHandler(KeepAliveHandler):
+            delay = 1
+
+        server, url = start_server(SlowHandler)
+        transport = PooledTransport()
+        try:
+            self.assertEqual(transport.request(url, 'a=1', 'POST', timeout=5), 'ok')
+            self.assertRaises(socket.timeout, transport.request, url, 'a=2', 'POST', timeout=0.3)
+            time.sleep(1)
+            self.assertEqual(len(server.requests), 2)
+        finally:
+            transport.close()
+            server.shutdown()
+
+    def test_stale_connection(self):
+        class ClosingHandler(KeepAliveHandler):
+            close_after_response = True
+
+        server, url = start_server(ClosingHandler)
+        transport = PooledTransport()
+        try:
+            self.assertEqual(transport.request(url, 'a=1', 'POST', timeout=5), 'ok')
+            time.sleep(0.1)
+            self.assertEqual(transport.request(url, 'a=2', 'POST', timeout=5), 'ok')
+            self.assertEqual(len(server.requests), 2)
+        finally:
+            transport.close()
+            server.shutdown()
+
+    def test_connect_timeout(self):
+        timeouts = []
+
+        class Connection(object):
+            def __init__(self, host, port, timeout=None):
+                timeouts.append(timeout)
+
+            def connect(self):
+                pass
+
+        transport = PooledTransport()
+        transport.connection_classes = {'http': Connection}
+        transport._acquire(('http', 'localhost', None), 5)
+        transport.connect_timeout = 2
+        transport._acquire(('http', 'localhost', None), 5)
+        self.assertEqual(timeouts, [5, 2])
+
+
+class FakeOrder(AbstractOrder):
+    sender_city_id = 44
+    recipient_name = u'Иванов Иван'
+    recipient_phone = '+7 (999) 999-99-99'
+    recipient_city_id = 137
+    recipient_address_street = None
+    recipient_address_house = None
+    recipient_address_flat = None
+    shipping_tariff = 137
+    shipping_price = 0
+
+    def __init__(self, number, pvz_code='SPB1', **kwargs):
+        self.number = number
+        self.pvz_code = pvz_code
+        self.__dict__.update(kwargs)
+
+    def get_products(self):
+        return []
+
+
+class FakeTransport(Transport):
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def request(self, url, data=None, method='GET', timeout=None):
+        self.requests.append(data)
+        return self.response
+
+
+class TestCreateOrders(unittest.TestCase):
+    def test_invalid_order(self):
+        transport = FakeTransport('<response><Order Number="1" DispatchNumber="101"/><Order Number="2" DispatchNumber="102"/></response>')
+        client = Client('login', 'password', transport=transport)
+        orders = [FakeOrder(1), FakeOrder(2), FakeOrder(3, recipient_name=None)]
+        results = client.create_orders(orders, batch_size=2, concurrency=1)
+
+        self.assertEqual([result.order for result in results], orders)
+        self.assertEqual([result.response['DispatchNumber'] for result in results[:2]], ['101', '102'])
+        self.assertIsInstance(results[2].error, Exception)
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_responses_by_number(self):
+        transport = FakeTransport(
+            '<response><Order Number="3" DispatchNumber="103"/><Order Number="1" ErrorCode="ERR_PVZ_NOT_FOUND"/>'
+            '<Order ErrorCode="ERR_ORDER_DUBL_EXISTS"/></response>'
+        )
+        results = Client('login', 'password', transport=transport).create_orders([FakeOrder(1), FakeOrder(2), FakeOrder(3)])
+
+        self.assertEqual(results[0].error, 'ERR_PVZ_NOT_FOUND')
+        self.assertEqual((results[1].response, results[1].error), (None, 'ERR_ORDER_DUBL_EXISTS'))
+        self.assertEqual((results[2].response['DispatchNumber'], results[2].error), ('103', None))
+
+    def test_common_error(self):
+        transport = FakeTransport('<response><Order ErrorCode="ERR_AUTH"/></response>')
+        results = Client('login', 'password', transport=transport).create_orders([FakeOrder(1), FakeOrder(2)])
+        self.assertEqual([result.error for result in results], ['ERR_AUTH', 'ERR_AUTH'])
+
+    def get_items(self, requests):
+        items = {}
+        for data in requests:
+            xml = ElementTree.fromstring(urlparse.parse_qs(data)['xml_request'][0])
+            for order in xml.findall('Order'):
+                items[order.get('Number')] = [item.get('WareKey') for item in order.iter('Item')]
+        return items
+
+    def test_load_products_data(self):
+        calls = []
+
+        class BookOrder(FakeOrder):
+            def get_products(self):
+                raise AssertionError('get_products called')
+
+            @classmethod
+            def load_products_data(cls, orders):
+                calls.append((cls, [order.number for order in orders]))
+                return [[OrderLineData('Book', 'B%s' % order.number, 300, 1, 100, 100)] for order in orders]
+
+        class EmptyOrder(FakeOrder):
+            @classmethod
+            def load_products_data(cls, orders):
+                calls.append((cls, [order.number for order in orders]))
+                return super(EmptyOrder, cls).load_products_data(orders)
+
+        transport = FakeTransport('<response><Order Number="1" DispatchNumber="101"/></response>')
+        client = Client('login', 'password', transport=transport)
+        client.create_orders([BookOrder(1), EmptyOrder(2), BookOrder(3), EmptyOrder(4)], batch_size=3)
+        self.assertEqual(sorted(calls), sorted([(BookOrder, [1, 3]), (EmptyOrder, [2, 4])]))
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(self.get_items(transport.requests), {'1': ['B1'], '2': [], '3': ['B3'], '4': []})
+
+    def test_products_data(self):
+        class Line(object):
+            def __getattr__(self, name):
+                raise AssertionError('%s called' % name)
+
+        class BookOrder(FakeOrder):
+            def get_products(self):
+                return [Line()]
+
+            def get_products_data(self):
+                return [OrderLineData('Book', 'B1', 300, 2, 100, 0), OrderLineData('Pen', 'P1', 50, 1, 20, 0)]
+
+        transport = FakeTransport('<response><Order Number="1" DispatchNumber="101"/></response>')
+        Client('login', 'password', transport=transport).create_order(BookOrder(1))
+        self.assertEqual(self.get_items(transport.requests), {'1': ['B1', 'P1']})
+        package = ElementTree.fromstring(urlparse.parse_qs(transport.requests[0])['xml_request'][0]).find('Order/Package')
+        self.assertEqual(package.get('Weight'), '350')
+
+
+class BrokenResponse(object):
+    """ Соединение обрывается после первого чтения ответа """
+
+    def __init__(self, response):
+        self.response = response
+        self.reads = 0
+
+    def read(self, amt=None):
+        self.reads += 1
+        if self.reads > 1:
+            raise socket.error('Connection reset by peer')
+        return self.response.read(amt)
+
+    def close(self):
+        self.response.close()
+
+
+class BrokenStreamTransport(Transport):
+    def __init__(self, transport):
+        self.transport = transport
+
+    def open(self, url, data=None, method='GET', timeout=None):
+        return BrokenResponse(self.transport.open(url, data, method, timeout))
+
+
+class TestPrintOrders(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server(payloads=load_payloads(pvz_count=1))
+        cls.server.handle_error = lambda request, client_address: None
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.client = make_client('http://127.0.0.1:%s' % self.server.server_port)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        type(self.client).transport.close()
+        shutil.rmtree(self.directory)
+
+    def test_print_orders(self):
+        os.mkdir(os.path.join(self.directory, '1'))
+        output = os.path.join(self.directory, '{first}', 'orders.pdf')
+        results = self.client.print_orders([1, 2, 3], output, chunk_size=2)
+
+        self.assertEqual(results[0].output, os.path.join(self.directory, '1', 'orders.pdf'))
+        self.assertIsNone(results[0].error)
+        self.assertTrue(open(results[0].output, 'rb').read().startswith('%PDF'))
+        self.assertIsInstance(results[1].error, IOError)
+
+    def test_output_error(self):
+        def output(index, orders_dispatch_numbers):
+            if index == 1:
+                raise ValueError(orders_dispatch_numbers)
+            return StringIO.StringIO()
+
+        results = self.client.print_orders([1, 2, 3], output, chunk_size=2)
+        self.assertTrue(results[0].output.getvalue().startswith('%PDF'))
+        self.assertIsInstance(results[1].error, ValueError)
+
+    def test_broken_stream(self):
+        self.client.transport = BrokenStreamTransport(self.client.transport)
+        output = os.path.join(self.directory, '{index}.pdf')
+        results = self.client.print_orders([1, 2, 3], output, chunk_size=2)
+
+        self.assertEqual([type(result.error) for result in results], [socket.error, socket.error])
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class ClosingResponse(StringIO.StringIO):
+    def __init__(self, data):
+        StringIO.StringIO.__init__(self, data)
+        self.closed_count = 0
+
+    def close(self):
+        self.closed_count += 1
+        StringIO.StringIO.close(self)
+
+
+class StreamTransport(Transport):
+    def __init__(self, response):
+        self.response = response
+        self.responses = []
+
+    def open(self, url, data=None, method='GET', timeout=None):
+        response = ClosingResponse(self.response)
+        self.responses.append(response)
+        return response
+
+
+class TestStreaming(unittest.TestCase):
+    points_response = (
+        '<PvzList>'
+        '<Pvz Code="MSK1" CityCode="44" coordX="37.62" coordY="55.75"><WeightLimit WeightMin="0" WeightMax="30"/></Pvz>'
+        '<Pvz Code="MSK2" CityCode="44" coordX="37.50" coordY="55.80"/>'
+        '<Pvz Code="MSK3" CityCode="44" coordX="37.40" coordY="55.70"/>'
+        '</PvzList>'
+    )
+    statuses_response = (
+        '<StatusReport>'
+        '<Order DispatchNumber="101" Number="1"><Status Date="2015-03-02T10:00:00+03:00" Code="4">'
+        '<State Date="2015-03-01T10:00:00+03:00" Code="1"/><State Date="2015-03-02T10:00:00+03:00" Code="4"/>'
+        '</Status></Order>'
+        '<Order DispatchNumber="102" Number="2"><Status Date="2015-03-01T10:00:00+03:00" Code="1"/></Order>'
+        '</StatusReport>'
+    )
+
+    def test_same_results(self):
+        for typed_results in (False, True):
+            client = Client('login', 'password', transport=StreamTransport(self.points_response), typed_results=typed_results)
+            self.assertEqual(list(client.iter_delivery_points(44)), client.get_delivery_points(44))
+
+            client.transport.response = self.statuses_response
+            self.assertEqual(list(client.iter_orders_statuses(['101', '102'])), client.get_orders_statuses(['101', '102']))
+
+    def test_elements_cleared(self):
+        elements = []
+        iterparse = ElementTree.iterparse
+
+        def recording_iterparse(source, events=None):
+            for event, element in iterparse(source, events):
+                elements.append(element)
+                yield event, element
+
+        client = Client('login', 'password', transport=StreamTransport(self.points_response))
+        ElementTree.iterparse = recording_iterparse
+        try:
+            points = client.iter_delivery_points()
+            self.assertEqual(next(points)['Code'], 'MSK1')
+            # обработанный пункт удален из дерева, следующие еще не прочитаны
+            self.assertEqual(len(elements[0]), 0)
+            self.assertEqual(len(elements[1]), 0)
+            self.assertEqual(elements[1].attrib, {})
+            self.assertEqual([point['Code'] for point in points], ['MSK2', 'MSK3'])
+        finally:
+            ElementTree.iterparse = iterparse
+
+        self.assertEqual(len(elements[0]), 0)
+        self.assertTrue(all(len(element) == 0 and not element.attrib for element in elements if element.tag == 'Pvz'))
+
+    def test_response_closed(self):
+        client = Client('login', 'password', transport=StreamTransport(self.points_response))
+        points = client.iter_delivery_points()
+        self.assertEqual(next(points)['Code'], 'MSK1')
+        self.assertEqual(client.transport.responses[0].closed_count, 0)
+        points.close()
+        self.assertEqual(client.transport.responses[0].closed_count, 1)
+
+        for _ in client.iter_orders_statuses(['101', '102']):
+            break
+        self.assertEqual(client.transport.responses[1].closed_count, 1)
+
+        list(client.iter_delivery_points())
+        self.assertEqual(client.transport.responses[2].closed_count, 1)
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRequestPolicy(unittest.TestCase):
+    def setUp(self):
+        import pycdek.client
+        self.time = FakeTime()
+        self.modules = [policy, pycdek.client]
+        for module in self.modules:
+            module.time = self.time
+
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        self.client = Client('login', 'password', circuit_breaker=self.breaker, policies={
+            Client.ORDER_STATUS_URL: RequestPolicy(timeout=5, retries=2, backoff=0.5, jitter=0),
+        })
+        self.calls = []
+
+    def tearDown(self):
+        for module in self.modules:
+            module.time = time
+
+    def send(self, url, errors):
+        def func(url, data, method, timeout):
+            self.calls.append(timeout)
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+
+        return self.client._send(url, 'data', 'POST', func)
+
+    def http_error(self, code):
+        return urllib2.HTTPError(Client.ORDER_STATUS_URL, code, 'Error', {}, StringIO.StringIO(''))
+
+    def test_get_delay(self):
+        request_policy = RequestPolicy(backoff=0.5, max_backoff=2, jitter=0)
+        self.assertEqual([request_policy.get_delay(attempt) for attempt in range(4)], [0.5, 1, 2, 2])
+        self.assertTrue(2 <= RequestPolicy(backoff=2, jitter=0.5).get_delay(0) <= 3)
+
+    def test_retries(self):
+        self.breaker.failure_threshold = 3
+        self.assertEqual(self.send(Client.ORDER_STATUS_URL, [urllib2.URLError('reset'), self.http_error(503)]), 'ok')
+        self.assertEqual(self.calls, [5, 5, 5])
+        self.assertEqual(self.time.sleeps, [0.5, 1])
+
+    def test_transport_timeout(self):
+        timeouts = []
+
+        class Connection(object):
+            def __init__(self, host, port, timeout=None):
+                timeouts.append(timeout)
+                raise socket.error('refused')
+
+        transport = PooledTransport(connect_timeout=None, read_timeout=120)
+        transport.connection_classes = {'http': Connection, 'https': Connection}
+        client = Client('login', 'password', transport=transport, policies={
+            Client.ORDER_STATUS_URL: RequestPolicy(timeout=5),
+        })
+        self.assertRaises(socket.error, client._exec_request, Client.CREATE_ORDER_URL, 'data', 'POST')
+        self.assertRaises(socket.error, client._exec_request, Client.ORDER_STATUS_URL, 'data', 'POST')
+        self.assertEqual(timeouts, [120, 5])
+
+    def test_client_error_not_retried(self):
+        self.assertRaises(urllib2.HTTPError, self.send, Client.ORDER_STATUS_URL, [self.http_error(404)])
+        self.assertEqual(len(self.calls), 1)
+        self.assertFalse(self.breaker.is_open)
+
+    def test_create_order_not_retried(self):
+        self.assertRaises(urllib2.URLError, self.send, Client.CREATE_ORDER_URL, [urllib2.URLError('reset')])
+        self.assertEqual(self.calls, [None])
+
+    def test_circuit_breaker(self):
+        self.assertRaises(urllib2.URLError, self.send, Client.CREATE_ORDER_URL, [urllib2.URLError('reset')])
+        self.assertFalse(self.breaker.is_open)
+        self.assertRaises(urllib2.URLError, self.send, Client.CREATE_ORDER_URL, [urllib2.URLError('reset')])
+        self.assertTrue(self.breaker.is_open)
+        self.assertRaises(CircuitOpenError, self.send, Client.CREATE_ORDER_URL, [])
+        self.assertEqual(len(self.calls), 2)
+
+        # пробный запрос завершился ошибкой, прерыватель снова открыт
+        self.time.now += 10
+        self.breaker.before_request()
+        self.assertRaises(CircuitOpenError, self.breaker.before_request)
+        self.breaker.record_failure()
+        self.assertRaises(CircuitOpenError, self.send, Client.CREATE_ORDER_URL, [])
+
+        self.time.now += 10
+        self.assertEqual(self.send(Client.CREATE_ORDER_URL, []), 'ok')
+        self.assertFalse(self.breaker.is_open)
+
+    def test_circuit_breaker_unexpected_error(self):
+        self.breaker.failure_threshold = 1
+        self.assertRaises(urllib2.URLError, self.send, Client.CREATE_ORDER_URL, [urllib2.URLError('reset')])
+        self.assertTrue(self.breaker.is_open)
+
+        # пробный запрос завершился ошибкой, которая не считается сетевой
+        self.time.now += 10
+        self.assertRaises(ValueError, self.send, Client.CREATE_ORDER_URL, [ValueError('hostname mismatch')])
+        self.assertTrue(self.breaker.is_open)
+
+        self.time.now += 10
+        self.assertEqual(self.send(Client.CREATE_ORDER_URL, []), 'ok')
+        self.assertFalse(self.breaker.is_open)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(2)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(self.time.sleeps, [0.5])
+
+        self.time.now += 10
+        for _ in range(2):
+            limiter.acquire()
+        self.assertEqual(self.time.sleeps, [0.5])
+
+
+class ErrorTransport(Transport):
+    def __init__(self, errors):
+        self.errors = errors
+
+    def request(self, url, data=None, method='GET', timeout=None):
+        raise self.errors.pop(0)
+
+
+class TestMetrics(unittest.TestCase):
+    orders_response = '<response><Order Number="1" DispatchNumber="101"/></response>'
+    statuses_response = '<StatusReport><Order DispatchNumber="101"><Status Date="2015-03-01T10:00:00+03:00" Code="1"/></Order></StatusReport>'
+
+    def test_histogram(self):
+        histogram = Histogram((1, 5, 10))
+        self.assertIsNone(histogram.percentile(50))
+        for value in (0.5, 2, 3, 7, 20):
+            histogram.add(value)
+
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual([histogram.percentile(percent) for percent in (20, 50, 80, 99)], [1, 5, 10, 20])
+        stats = histogram.as_dict()
+        self.assertEqual((stats['count'], stats['sum'], stats['min'], stats['max']), (5, 32.5, 0.5, 20))
+        self.assertEqual(stats['buckets'], [(1, 1), (5, 2), (10, 1), (None, 1)])
+
+        # перцентиль не больше максимального значения
+        histogram = Histogram((1, 5, 10))
+        histogram.add(2)
+        self.assertEqual(histogram.percentile(50), 2)
+
+    def test_stages(self):
+        metrics = InMemoryMetrics()
+        transport = FakeTransport(self.orders_response)
+        client = Client('login', 'password', transport=transport, metrics=metrics)
+        client.create_order(FakeOrder(1))
+        transport.response = self.statuses_response
+        client.get_orders_statuses(['101'])
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(sorted(snapshot['timings']), [
+            ('new_orders.php', 'network'), ('new_orders.php', 'parse'), ('new_orders.php', 'serialize'), ('new_orders.php', 'sign'),
+            ('status_report_h.php', 'convert'), ('status_report_h.php', 'network'), ('status_report_h.php', 'parse'),
+            ('status_report_h.php', 'serialize'), ('status_report_h.php', 'sign'),
+        ])
+        self.assertEqual(snapshot['sizes'][('new_orders.php', 'request')]['sum'], len(transport.requests[0]))
+        self.assertEqual(snapshot['sizes'][('status_report_h.php', 'response')]['sum'], len(self.statuses_response))
+        self.assertEqual(snapshot['errors'], {})
+
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {'timings': {}, 'sizes': {}, 'errors': {}})
+
+    def test_errors(self):
+        metrics = InMemoryMetrics()
+        http_error = urllib2.HTTPError(Client.CREATE_ORDER_URL, 404, 'Not Found', {}, StringIO.StringIO(''))
+        client = Client('login', 'password', metrics=metrics, transport=ErrorTransport([
+            urllib2.URLError('reset'), urllib2.URLError('reset'), http_error,
+        ]))
+        for _ in range(3):
+            self.assertRaises(urllib2.URLError, client._exec_request, Client.CREATE_ORDER_URL, 'data', 'POST')
+
+        self.assertEqual(metrics.snapshot()['errors'], {('new_orders.php', 'URLError'): 2, ('new_orders.php', 'HTTPError'): 1})
+        self.assertEqual(metrics.timings[('new_orders.php', 'network')].count, 3)
+
+    def test_disabled(self):
+        import pycdek.client
+
+        def timer(*args):
+            raise AssertionError('Timer created with disabled metrics')
+
+        pycdek.client.Timer = timer
+        try:
+            client = Client('login', 'password', transport=FakeTransport(self.orders_response))
+            self.assertEqual(client.create_order(FakeOrder(1)), {'Number': '1', 'DispatchNumber': '101'})
+        finally:
+            pycdek.client.Timer = Timer
+
+
+class TestAsyncClient(unittest.TestCase):
+    def test_client_options(self):
+        transport = FakeTransport('<response><Order Number="1" DispatchNumber="101"/></response>')
+        client = AsyncClient('login', 'password', transport, concurrency=2, typed_results=True, clock=lambda: '2015-03-01T12:00:00')
+        try:
+            self.assertEqual(client.create_order(FakeOrder(1)).get(1)['DispatchNumber'], '101')
+            self.assertIn('Date%3D%222015-03-01T12%3A00%3A00%22', transport.requests[0])
+            self.assertTrue(client.typed_results)
+            self.assertEqual(client.concurrency_limiter.limit, 2)
+        finally:
+            client.close()
+
+    def test_client_pool(self):
+        transport = FakeTransport('<response><Order Number="1" DispatchNumber="101"/><Order Number="2" DispatchNumber="102"/></response>')
+        pool = ClientPool({'a': ('login-a', 'password'), 'b': ('login-b', 'password')}, client_class=AsyncClient,
+                          transport=transport, concurrency=3)
+        orders = [FakeOrder(1, cdek_account='b'), FakeOrder(2, cdek_account='a')]
+        results = pool.create_orders(orders)
+        self.assertEqual([result.response['DispatchNumber'] for result in results], ['101', '102'])
+        self.assertEqual(pool['a'].concurrency_limiter.limit, 3)
+        for client in pool.clients.values():
+            client.close()
+
+
+class TestQuoteEngine(unittest.TestCase):
+    prices = {
+        (44, 137, 136): (500, 3, 4),
+        (44, 137, 137): (300, 5, 7),
+        (44, 137, 11): (300, 2, 3),
+        (44, 270, 136): (900, 6, 8),
+    }
+
+    def get_shipping_cost(self, sender_city_id, receiver_city_id, tariffs, goods):
+        price = self.prices.get((sender_city_id, receiver_city_id, tariffs[0]))
+        if price is None:
+            return {'error': [{'code': 3, 'text': 'Tariff is not available'}]}
+
+        return {'result': {'price': price[0], 'deliveryPeriodMin': price[1], 'deliveryPeriodMax': price[2], 'tariffId': tariffs[0]}}
+
+    def setUp(self):
+        client = type('FakeClient', (object,), {'get_shipping_cost': lambda _, *args: self.get_shipping_cost(*args)})()
+        self.engine = QuoteEngine(client, concurrency=2)
+        self.quotes = self.engine.compare([(44, 137, []), (44, 270, [])], [136, 137, 11])
+
+    def test_compare(self):
+        self.assertEqual([(quote.route_index, quote.tariff) for quote in self.quotes],
+                         [(0, 136), (0, 137), (0, 11), (1, 136), (1, 137), (1, 11)])
+        self.assertEqual(self.quotes[0].price, 500)
+        self.assertIsNone(self.quotes[4].price)
+        self.assertIsNotNone(self.quotes[4].error)
+
+    def test_strategies(self):
+        self.assertEqual(self.engine.best(self.quotes, cheapest).tariff, 11)
+        self.assertEqual(self.engine.best(self.quotes[:2], cheapest).tariff, 137)
+        self.assertEqual(self.engine.best(self.quotes[:2], fastest).tariff, 136)
+        self.assertEqual(self.engine.best(self.quotes[:2], cheapest_within(5)).tariff, 136)
+        self.assertEqual(self.engine.best(self.quotes[:2], cheapest_within(10)).tariff, 137)
+        self.assertIsNone(self.engine.best(self.quotes[4:]))
+
+    def test_string_periods(self):
+        # сроки строками: '10' < '9' при сравнении строк
+        self.prices = {(44, 137, 136): ('500', '3', '10'), (44, 137, 137): ('300', '5', '9'), (44, 137, 11): ('700', '2', '3')}
+        quotes = self.engine.compare([(44, 137, [])], [136, 137, 11])
+
+        self.assertEqual(quotes[0].period_max, 10)
+        self.assertEqual(self.engine.best(quotes, fastest).tariff, 11)
+        self.assertEqual(self.engine.best(quotes[:2], fastest).tariff, 137)
+        self.assertEqual(self.engine.best(quotes, cheapest_within(5)).tariff, 11)
+
+    def test_invalid_response(self):
+        def get_shipping_cost(sender_city_id, receiver_city_id, tariffs, goods):
+            if tariffs[0] == 137:
+                raise ValueError('No JSON object could be decoded')
+            return self.get_shipping_cost(sender_city_id, receiver_city_id, tariffs, goods)
+
+        self.engine.client = type('FakeClient', (object,), {'get_shipping_cost': lambda _, *args: get_shipping_cost(*args)})()
+        quotes = self.engine.compare([(44, 137, [])], [136, 137])
+        self.assertEqual(quotes[0].price, 500)
+        self.assertIsInstance(quotes[1].error, ValueError)
+
+    def test_as_matrix(self):
+        matrix = self.engine.as_matrix(self.quotes)
+        self.assertEqual(matrix.keys(), [0, 1])
+        self.assertEqual(matrix[1].keys(), [136, 137, 11])
+        self.assertEqual(matrix[0][137].price, 300)
+        self.assertEqual([quote.tariff for quote in self.engine.best_by_route(self.quotes)], [11, 136])
+
+
+class TestTariffEstimator(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        client = type('FakeClient', (object,), {'get_shipping_cost': lambda _, *args: self.get_shipping_cost(*args)})()
+        self.estimator = TariffEstimator(client, min_samples=2, max_spread=0.2)
+
+    def get_shipping_cost(self, sender_city_id, receiver_city_id, tariffs, goods):
+        self.requests.append(goods)
+        return {'result': {'price': '450', 'deliveryPeriodMin': '3', 'deliveryPeriodMax': '4', 'tariffId': tariffs[0]}}
+
+    def learn(self, weight, price):
+        return self.estimator.learn(44, 137, 136, weight, {'result': {'price': price, 'deliveryPeriodMin': 2, 'deliveryPeriodMax': 3}})
+
+    def test_brackets(self):
+        self.assertEqual([self.estimator.get_bracket(weight) for weight in (0.1, 0.5, 0.6, 1, 100, 150)], [0, 0, 1, 1, 10, 11])
+
+        self.learn(1.5, 500)
+        self.assertEqual(self.estimator.estimate(44, 137, 136, 1.9).samples, 1)
+        self.assertIsNone(self.estimator.estimate(44, 137, 136, 2.1))
+        self.assertIsNone(self.estimator.estimate(44, 137, 137, 1.9))
+        self.assertFalse(self.estimator.learn(44, 137, 136, 1, {'error': []}))
+        self.assertFalse(self.estimator.learn(44, 137, 136, 1, {'result': {'price': 500, 'tariffId': 137}}))
+
+    def test_confidence(self):
+        self.learn(1.5, 500)
+        self.assertFalse(self.estimator.estimate(44, 137, 136, 1.5).confident)
+        self.learn(1.8, 450)
+        estimate = self.estimator.estimate(44, 137, 136, 1.5)
+        self.assertEqual((estimate.price_min, estimate.price_max, estimate.samples, estimate.confident), (450, 500, 2, True))
+        self.learn(1.2, 300)
+        self.assertFalse(self.estimator.estimate(44, 137, 136, 1.5).confident)
+
+    def test_get_shipping_estimate(self):
+        goods = [{'weight': 1, 'length': 10, 'width': 10, 'height': 10}]
+        self.assertEqual(self.estimator.get_shipping_estimate(44, 137, 136, goods).price_min, 450)
+        self.estimator.get_shipping_estimate(44, 137, 136, goods)
+        self.assertTrue(self.estimator.get_shipping_estimate(44, 137, 136, goods).confident)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_save_load(self):
+        self.learn(1.5, 500)
+        self.learn(7, 900)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'estimates')
+            self.estimator.save(path)
+            umask = os.umask(022)
+            try:
+                self.estimator.save(path)
+            finally:
+                os.umask(umask)
+            self.assertEqual(os.listdir(directory), ['estimates'])
+            self.assertEqual(os.stat(path).st_mode & 0777, 0644)
+
+            estimator = TariffEstimator().load(path)
+            self.assertEqual(len(estimator), 2)
+            self.assertEqual(estimator.estimate(44, 137, 136, 7), self.estimator.estimate(44, 137, 136, 7))
+
+            estimator.weight_brackets = (1, 10)
+            self.assertRaises(ValueError, estimator.load, path)
+        finally:
+            shutil.rmtree(directory)
+
+
+class EchoTransport(Transport):
+    """ Отвечает на создание заказов номерами отправлений вида <логин>-<номер заказа> """
+
+    def request(self, url, data=None, method='GET', timeout=None):
+        xml = ElementTree.fromstring(urlparse.parse_qs(data)['xml_request'][0])
+        return '<response>%s</response>' % ''.join(
+            '<Order Number="%s" DispatchNumber="%s-%s"/>' % (order.get('Number'), xml.get('Account'), order.get('Number'))
+            for order in xml.findall('Order')
+        )
+
+
+class TestClientPool(unittest.TestCase):
+    def test_create_orders(self):
+        pool = ClientPool({'a': ('login-a', 'password-a'), 'b': ('login-b', 'password-b')}, transport=EchoTransport())
+        orders = [FakeOrder(i, cdek_account='ab'[i % 3 == 0]) for i in range(1, 8)]
+        results = pool.create_orders(orders, batch_size=2, concurrency=2)
+
+        self.assertEqual([result.order for result in results], orders)
+        self.assertEqual([result.response['DispatchNumber'] for result in results],
+                         ['login-a-1', 'login-a-2', 'login-b-3', 'login-a-4', 'login-a-5', 'login-b-6', 'login-a-7'])
+
+    def test_single_account(self):
+        pool = ClientPool({'a': ('login-a', 'password-a')}, transport=EchoTransport())
+        self.assertEqual(pool.route(FakeOrder(1)), 'a')
+        self.assertEqual(pool.create_order(FakeOrder(1))['DispatchNumber'], 'login-a-1')
+
+
+class TestQuoteCache(unittest.TestCase):
+    def test_make_quote_key(self):
+        params = {
+            'dateExecute': '2015-01-01',
+            'senderCityId': 44,
+            'receiverCityId': 137,
+            'tariffList': [{'priority': -1, 'id': 11}, {'priority': -2, 'id': 16}],
+            'goods': [{'weight': 2, 'length': 100}, {'weight': 1, 'length': 50}],
+        }
+        key = make_quote_key(params)
+
+        params['goods'] = list(reversed(params['goods']))
+        self.assertEqual(make_quote_key(params), key)
+
+        params['dateExecute'] = '2015-01-02'
+        self.assertNotEqual(make_quote_key(params), key)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = MemoryQuoteCache(ttl=60, max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        self.assertEqual(cache.get('a'), '1')
+        cache.set('c', '3')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+        cache.ttl = -1
+        cache.set('d', '4')
+        self.assertIsNone(cache.get('d'))
+
+
+class TestDeliveryPointCatalog(unittest.TestCase):
+    points = [
+        {'Code': 'MSK1', 'CityCode': '44', 'PostalCode': '101000', 'coordX': '37.62', 'coordY': '55.75'},
+        {'Code': 'MSK2', 'CityCode': '44', 'PostalCode': '101000', 'coordX': '37.50', 'coordY': '55.80'},
+        {'Code': 'SPB1', 'CityCode': '137', 'coordX': '30.31', 'coordY': '59.94'},
+    ]
+
+    def setUp(self):
+        client = type('FakeClient', (object,), {'get_delivery_points': lambda _: self.points})()
+        self.catalog = DeliveryPointCatalog(client)
+
+    def test_indexes(self):
+        self.assertEqual(self.catalog.get('SPB1')['CityCode'], '137')
+        self.assertEqual(len(self.catalog.get_city_points(44)), 2)
+        self.assertEqual(len(self.catalog.get_postcode_points(101000)), 2)
+
+    def test_nearest_points(self):
+        points = self.catalog.get_nearest_points(59.9, 30.3, limit=2)
+        self.assertEqual([point['Code'] for _, point in points], ['SPB1', 'MSK2'])
+        self.assertEqual(self.catalog.get_nearest_points(59.9, 30.3, limit=2, max_distance=100)[0][1]['Code'], 'SPB1')
+
+    def test_snapshot(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.catalog.save_snapshot(path)
+            with DeliveryPointSnapshot(path) as snapshot:
+                self.assertEqual(len(snapshot), 3)
+                self.assertEqual(snapshot.get('MSK2'), self.points[1])
+                self.assertIsNone(snapshot.get('MSK3'))
+                self.assertEqual([point['Code'] for point in snapshot.get_city_points(44)], ['MSK1', 'MSK2'])
+                self.assertEqual(len(snapshot.get_postcode_points(101000)), 2)
+                self.assertEqual(snapshot.get_city_points(270), [])
+
+            umask = os.umask(022)
+            try:
+                self.catalog.save_snapshot(path)
+            finally:
+                os.umask(umask)
+            self.assertEqual(os.stat(path).st_mode & 0777, 0644)
+        finally:
+            os.unlink(path)
+
+
+class TestSigner(unittest.TestCase):
+    def test_sign(self):
+        signer = Signer('login', 'password', clock=lambda: '2015-03-01T12:00:00')
+        attrib = signer.sign({'OrderCount': '1'})
+        self.assertEqual(attrib['Account'], 'login')
+        self.assertEqual(attrib['Date'], '2015-03-01T12:00:00')
+        self.assertEqual(attrib['Secure'], hashlib.md5('2015-03-01T12:00:00&password').hexdigest())
+
+    def test_sign_many(self):
+        attribs = Signer('login', 'password').sign_many([{}, {'CopyCount': '2'}])
+        self.assertEqual(attribs[0]['Secure'], attribs[1]['Secure'])
+        self.assertEqual(attribs[1]['CopyCount'], '2')
+
+
+class StatusReportTransport(Transport):
+    def __init__(self):
+        self.codes = {}
+        self.failures = set()
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def request(self, url, data=None, method='GET', timeout=None):
+        xml = ElementTree.fromstring(urlparse.parse_qs(data)['xml_request'][0])
+        numbers = [order.get('DispatchNumber') for order in xml.findall('Order')]
+        with self._lock:
+            self.requests.append((xml.get('ShowHistory'), numbers))
+        if self.failures.intersection(numbers):
+            raise urllib2.URLError('reset')
+
+        return '<StatusReport>%s</StatusReport>' % ''.join(
+            '<Order DispatchNumber="%s"><Status Date="2015-03-01T10:00:00" Code="%s"/></Order>' % (number, self.codes.get(number, 1))
+            for number in numbers
+        )
+
+
+class TestStatusTracker(unittest.TestCase):
+    def setUp(self):
+        self.transport = StatusReportTransport()
+        client = Client('login', 'password', transport=self.transport, policies={Client.ORDER_STATUS_URL: RequestPolicy()})
+        self.tracker = StatusTracker(client, batch_size=2, concurrency=2)
+
+    def get_numbers(self, orders):
+        return [order['DispatchNumber'] for order in orders]
+
+    def test_batches(self):
+        orders = self.tracker.poll([101, '102', 103, 101, '103', 104, 105])
+        self.assertEqual(self.get_numbers(orders), ['101', '102', '103', '104', '105'])
+        self.assertEqual(sorted(self.transport.requests), [
+            ('0', ['101', '102']), ('0', ['103', '104']), ('0', ['105']),
+        ])
+        self.assertEqual(self.tracker.get_state(101), ('1', '2015-03-01T10:00:00'))
+
+    def test_changes(self):
+        numbers = ['101', '102', '103']
+        self.assertEqual(len(self.tracker.poll(numbers)), 3)
+        self.assertEqual(self.tracker.poll(numbers), [])
+
+        self.transport.codes['102'] = 4
+        self.assertEqual(self.get_numbers(self.tracker.poll(numbers)), ['102'])
+        self.assertEqual(self.tracker.poll(numbers), [])
+
+        self.tracker.forget(['102'])
+        self.assertEqual(self.get_numbers(self.tracker.poll(numbers)), ['102'])
+
+    def test_failed_batch(self):
+        numbers = ['101', '102', '103']
+        self.transport.failures.add('101')
+        self.assertEqual(self.get_numbers(self.tracker.poll(numbers)), ['103'])
+        self.assertIsNone(self.tracker.get_state('102'))
+
+        # пачка с ошибкой запрашивается снова при следующем вызове
+        self.transport.failures.clear()
+        self.assertEqual(self.get_numbers(self.tracker.poll(numbers)), ['101', '102'])
+        self.assertEqual(len(self.tracker), 3)
+
+    def test_show_history(self):
+        self.tracker.fetch(['101'])
+        self.tracker.fetch(['101'], show_history=True)
+        self.assertEqual([show_history for show_history, _ in self.transport.requests], ['0', '1'])
+
+
+class TestStatusFeed(unittest.TestCase):
+    def setUp(self):
+        self.states = [{'Date': '2015-03-01T10:00:00+03:00', 'Code': '1'}]
+        self.invalid_states = {}
+        self.requests = []
+        self.delay = 0
+        self.now = 0
+        client = type('FakeClient', (object,), {'get_orders_statuses': self.get_orders_statuses})()
+        self.feed = StatusFeed(client, min_interval=10, max_interval=40, clock=lambda: self.now)
+        self.events = []
+        self.feed.subscribe(self.events.append)
+        self.feed.track(['1000028000'])
+
+    def tearDown(self):
+        self.feed.close()
+
+    def get_orders_statuses(self, orders_dispatch_numbers, show_history=True):
+        self.requests.append(show_history)
+        time.sleep(self.delay)
+        orders = []
+        for number in orders_dispatch_numbers:
+            states = self.invalid_states.get(number, self.states)
+            status = dict(states[-1], State=list(states)) if show_history else dict(states[-1])
+            orders.append({'DispatchNumber': number, 'Status': status})
+        return orders
+
+    def test_poll(self):
+        self.assertEqual(len(self.feed.poll()), 1)
+        self.assertEqual(self.feed.get_cursor('1000028000'), '2015-03-01T07:00:00')
+
+        self.now = 10
+        self.assertEqual(self.feed.poll(), [])
+        self.now = 20
+        self.assertEqual(self.feed.poll(), [])
+
+        self.states.append({'Date': '2015-03-02T10:00:00+03:00', 'Code': '4'})
+        self.now = 30
+        events = self.feed.poll()
+        self.assertEqual([event.state['Code'] for event in events], ['4'])
+        self.assertEqual(self.requests, [False, True, False, False, True])
+        self.assertEqual(len(self.events), 2)
+        self.assertEqual(len(self.feed), 0)
+
+    def test_failed_consumer(self):
+        self.states.append({'Date': '2015-03-02T10:00:00+03:00', 'Code': '3'})
+        failures = [True]
+
+        def consumer(event):
+            if event.state['Code'] == '3' and failures:
+                failures.pop()
+                raise ValueError(event)
+
+        self.feed.subscribe(consumer)
+        self.assertEqual([event.state['Code'] for event in self.feed.poll()], ['1'])
+        self.assertEqual(self.feed.get_cursor('1000028000'), '2015-03-01T07:00:00')
+
+        self.now = 10
+        self.assertEqual([event.state['Code'] for event in self.feed.poll()], ['3'])
+        self.assertEqual(self.feed.get_cursor('1000028000'), '2015-03-02T07:00:00')
+
+    def test_invalid_date(self):
+        self.feed.track(['1000028001', '1000028002'])
+        self.invalid_states['1000028001'] = [{'Date': None, 'Code': '1'}]
+        self.invalid_states['1000028002'] = [{'Date': '2015-03-01T10:00:00+03:00', 'Code': '1'}, {'Date': 'invalid', 'Code': '3'}]
+        self.assertEqual([event.dispatch_number for event in self.feed.poll()], ['1000028000'])
+        self.assertIsNone(self.feed.get_cursor('1000028001'))
+        self.assertIsNone(self.feed.get_cursor('1000028002'))
+
+        # заказы с ошибочной датой запрашиваются снова при следующем опросе
+        del self.invalid_states['1000028001']
+        del self.invalid_states['1000028002']
+        self.assertEqual(sorted(event.dispatch_number for event in self.feed.poll()), ['1000028001', '1000028002'])
+
+    def test_concurrent_poll(self):
+        self.delay = 0.05
+        threads = [threading.Thread(target=self.feed.poll) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.events), 1)
+
+
+class TestRecords(unittest.TestCase):
+    def test_order_status(self):
+        xml = ElementTree.fromstring(
+            '<Order DispatchNumber="1000028000" DeliveryDate="2014-08-29T14:48:26+04:00">'
+            '<Status Date="2014-08-29T14:48:26+04:00" Code="4" CityCode="44"><State Date="2014-08-28" Code="1"/></Status>'
+            '<Package Number="1"><Item WareKey="25" Amount="2"/></Package>'
+            '</Order>'
+        )
+        order = OrderStatus.from_xml(xml)
+
+        self.assertEqual(order.dispatch_number, '1000028000')
+        self.assertEqual(order.status.code, 4)
+        self.assertEqual(order.status.date.utcoffset(), datetime.timedelta(hours=4))
+        self.assertEqual(order.status.states[0].date, datetime.date(2014, 8, 28))
+        self.assertEqual(order.packages[0].items[0].amount, 2)
+        self.assertEqual(order['Status']['Code'], 4)
+        self.assertRaises(KeyError, lambda: order['Unknown'])
+
+    def test_extra(self):
+        pvz = Pvz.from_xml(ElementTree.fromstring(
+            '<Pvz Code="MSK1" CityCode="44" coordX="n/a" IsDressingRoom="true">'
+            '<WeightLimit WeightMin="0" WeightMax="30"/><OfficeImage url="1.jpg"/><OfficeImage url="2.jpg"/>'
+            '</Pvz>'
+        ))
+
+        self.assertEqual(pvz.city_code, 44)
+        self.assertIsNone(pvz.coord_x)
+        self.assertEqual(pvz.extra['coordX'], 'n/a')
+        self.assertEqual(pvz['IsDressingRoom'], 'true')
+        self.assertEqual(pvz['WeightLimit'], [{'WeightMin': '0', 'WeightMax': '30'}])
+        self.assertEqual(len(pvz['OfficeImage']), 2)
+        self.assertIsNone(Pvz.from_xml(ElementTree.fromstring('<Pvz Code="MSK1"/>')).extra)
+
+
+class TestXmlWriter(unittest.TestCase):
+    def test_matches_element_tree(self):
+        attrib = {'Number': '1', 'RecipientName': u'Иван "Иванов" & <Co>\n', 'Comment': ''}
+        item = {'Amount': '2', 'WareKey': 'A&B'}
+
+        root = ElementTree.Element('DeliveryRequest', OrderCount='1')
+        order = ElementTree.SubElement(root, 'Order', attrib)
+        ElementTree.SubElement(order, 'Item', item)
+        ElementTree.SubElement(root, 'Order', Number='2')
+        buff = StringIO.StringIO()
+        ElementTree.ElementTree(root).write(buff, encoding='UTF-8', xml_declaration=False)
+
+        writer = XmlWriter()
+        writer.start('Order', attrib)
+        writer.write(ElementTemplate('Item', 'WareKey', 'Amount').render(**item))
+        writer.end('Order')
+        writer.element('Order', {'Number': '2'})
+
+        self.assertEqual(
+            make_document('DeliveryRequest', {'OrderCount': '1'}, writer.getvalue()),
+            '<?xml version="1.0" encoding="UTF-8" ?>' + buff.getvalue()
+        )
+
+
 if __name__ == '__main__':
     unittest.main()